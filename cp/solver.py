@@ -3,13 +3,25 @@ import json
 import subprocess
 from pathlib import Path
 import re
+import time
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Optional, Tuple, Any
-from setup.config import glob
+from setup.config import glob, OutputBuffer
+from setup.heuristic import heuristic_solution
 
 class CPSolver:
-    def __init__(self,data, timeout: int = 300):
+    def __init__(self,data, timeout: int = 300, workers: int = 1, cache: bool = True, lns: bool = False,
+                 warm_start: bool = True, successor: bool = False):
         
         self.timeout = timeout
+        self.workers = workers
+        self.cache = cache
+        self.lns = lns
+        self.successor = successor
+        self.warm_start = warm_start
+        self.cache_dir = os.path.join(tempfile.gettempdir(), "mcp_fzn_cache")
         self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.models_dir = os.path.join(self.base_dir, "cp", "Models")
         self.output_dir = os.path.join(self.base_dir, "output", "cp")
@@ -39,12 +51,48 @@ class CPSolver:
         
         return m, n, l, s, D
 
-    def create_dzn_file(self, m: int, n: int, l: List[int], s: List[int], D: List[List[int]]) -> str:
+    def compute_bounds(self, m: int, n: int, l: List[int], s: List[int], D: List[List[int]]
+                       ) -> Tuple[int, int, Optional[List[List[int]]]]:
+        """
+        Lower bound: the farthest round trip from the depot, since every item is on a tour.
+        Upper bound: the objective of the greedy heuristic solution.
+
+        Returns:
+            (lower bound, upper bound, routes of the heuristic solution with 0-based items).
+            If the heuristic fails the routes are None and the upper bound is the sum of
+            the row maxima of D, which no tour can exceed.
+        """
+        lower_bound = max(D[n][i] + D[i][n] for i in range(n))
+
+        heuristic = heuristic_solution(m, n, l, s, D)
+        if heuristic is None:
+            return lower_bound, sum(max(row) for row in D), None
+
+        routes, upper_bound = heuristic
+        return lower_bound, upper_bound, routes
+
+    def create_dzn_file(self, m: int, n: int, l: List[int], s: List[int], D: List[List[int]],
+                        lower_bound: int, upper_bound: int, routes: Optional[List[List[int]]] = None) -> str:
+        """
+        Data of the models: the instance, the bounds of the objective and the optional warm
+        start solution (its paths, depot first and last, padded with 0 up to n+2 positions).
+        Without a warm start the paths of unused couriers are passed and Use_warm is false.
+        """
+        use_warm = routes is not None
+        if not use_warm:
+            routes = [[] for _ in range(m)]
+        paths = [[n + 1] + [i + 1 for i in route] + [n + 1] + [0] * (n - len(route)) for route in routes]
+
         dzn_file = f"""
         m = {m};
         n = {n};
         l = {l};
         s = {s};
+        LB = {lower_bound};
+        UB = {upper_bound};
+        Use_warm = {'true' if use_warm else 'false'};
+        Warm_length = {[len(route) + 2 for route in routes]};
+        Warm_path = [|{" |".join(" " + ", ".join(map(str, path)) for path in paths)} |];
         D = [|"""
         
         # Format the distance matrix with | separators between rows
@@ -57,7 +105,13 @@ class CPSolver:
         
         return dzn_file
 
-    def parse_mzn_output(self, output_string: str, timeout: int) -> Dict[str, Any]:
+    def parse_mzn_output(self, output_string: str) -> Tuple[Optional[int], List[List[int]]]:
+        """
+        Parse the text printed by the output item of the models for one solution.
+
+        Returns:
+            (objective value, list of the paths of the couriers)
+        """
         obj_value = None
         solution = []
 
@@ -67,58 +121,203 @@ class CPSolver:
             obj_value = int(match.group(1))
 
         # Extract courier paths
-        path_pattern = re.compile(r"courier (\d+):\s*path:\s*([\d\s]+)\s*total distance:\s*(\d+)")
+        path_pattern = re.compile(r"courier (\d+):\s*path:\s*([\d\s]*?)\s*total distance:\s*(\d+)")
         for match in path_pattern.finditer(output_string):
-            path = list(map(int, match.group(2).strip().split()))
+            path = list(map(int, match.group(2).split()))
             solution.append(path)
 
-        # Extract elapsed time
-        time_match = re.search(r"% time elapsed: ([\d.]+) s", output_string)
-        elapsed_time = float(time_match.group(1)) if time_match else timeout
+        return obj_value, solution
 
-        return {
-            "time": min(timeout, int(elapsed_time)),
-            "optimal": elapsed_time < timeout,
-            "obj": obj_value,
-            "sol": solution if solution else None,
-        }
+    def run_minizinc_model(self, inputs: List[str], solver: str, window=None) -> Dict[str, Any]:
+        """
+        Run a model with intermediate solutions streamed as JSON messages (one per line,
+        MiniZinc >= 2.6), so the incumbent is kept as soon as it is found, even if the
+        run is interrupted, and the optimality is the status reported by the solver.
 
-    def run_minizinc_model(self, model_path: str, dzn_path: str, solver: str) -> Dict[str, Any]:
-        try:
-            process = subprocess.Popen(
-                [
-                    "minizinc",
-                    "-m", model_path,
-                    "-d", dzn_path,
-                    "--solver", solver,
-                    "--output-time",
-                    "--solver-time-limit", str(self.timeout * 1000),
-                    "-s"
-                ],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                shell=False
-            )
+        The inputs are either the model and its data (-m model.mzn -d data.dzn) or an
+        already compiled model (model.fzn --ozn-file model.ozn).
 
-            output_lines = []
+        Returns:
+            Dictionary {time, optimal, obj, sol} completed with the solver status, the time
+            at which the incumbent was found and the anytime curve [[time, obj], ...]
+        """
+        window = window or self.window
+        incumbent = {"obj": None, "sol": None, "time": None}
+        curve = []
+        status = "UNKNOWN"
+        elapsed_time = None
+        start = time.time()
+
+        process = subprocess.Popen(
+            [
+                "minizinc",
+                *inputs,
+                "--solver", solver,
+                "--json-stream",
+                "--intermediate",
+                "--output-time",
+                "--solver-time-limit", str(self.timeout * 1000),
+                "-s"
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            shell=False
+        )
+
+        try:
             for line in iter(process.stdout.readline, ''):
-                output_lines.append(line)
-            
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                if message.get("type") == "solution":
+                    output = message.get("output", {})
+                    obj_value, solution = self.parse_mzn_output(output.get("default", output.get("raw", "")))
+                    found = message.get("time", (time.time() - start) * 1000) / 1000
+                    incumbent = {"obj": obj_value, "sol": solution if solution else None, "time": found}
+                    curve.append([round(found, 3), obj_value])
+                    window.print_output(f"  {solver}: objective {obj_value} at {found:.2f} s")
+
+                elif message.get("type") == "status":
+                    status = message.get("status", status)
+                    if "time" in message:
+                        elapsed_time = message["time"] / 1000
+
+                elif message.get("type") == "error":
+                    window.print_output(f"MiniZinc error: {message.get('message')}")
+
             process.stdout.close()
             process.wait(timeout=self.timeout + 1)
 
-            output_string = "".join(output_lines)
-            return self.parse_mzn_output(output_string, self.timeout)
-
         except subprocess.TimeoutExpired:
-            self.window.print_output(f"MiniZinc process timed out for model {model_path}.")
-            return {
-                "time": self.timeout,
-                "optimal": False,
-                "obj": None,
-                "sol": None
-            }
+            process.kill()
+            window.print_output(f"MiniZinc process timed out for model {inputs[1] if inputs[0] == '-m' else inputs[0]}.")
+
+        if elapsed_time is None:
+            elapsed_time = time.time() - start
+        optimal = status == "OPTIMAL_SOLUTION"
+
+        return {
+            "time": min(self.timeout, int(elapsed_time)) if optimal else self.timeout,
+            "optimal": optimal,
+            "obj": incumbent["obj"],
+            "sol": incumbent["sol"],
+            "status": status,
+            "incumbent_time": incumbent["time"],
+            "curve": curve
+        }
+
+    def model_files(self, model_path: str) -> List[str]:
+        """
+        The model file followed by the files it includes, directly or not, from its own
+        folder (the library includes such as globals.mzn are not files of the project).
+        """
+        files = [model_path]
+        for path in files:
+            with open(path, 'r') as f:
+                for name in re.findall(r'^\s*include\s+"([^"]+)"\s*;', f.read(), re.MULTILINE):
+                    included = os.path.join(os.path.dirname(path), name)
+                    if os.path.exists(included) and included not in files:
+                        files.append(included)
+        return files
+
+    def flatzinc_paths(self, model_path: str, dzn_content: str, solver: str) -> Tuple[str, str]:
+        """
+        Paths of the compiled model in the cache, keyed by a hash of the model file and of
+        the files it includes from the models folder, the data and the solver (flattening
+        depends on the solver's library of globals).
+        """
+        digest = hashlib.sha256()
+        for path in self.model_files(model_path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        digest.update(dzn_content.encode())
+        digest.update(solver.encode())
+
+        name = f"{Path(model_path).stem}_{solver}_{digest.hexdigest()[:16]}"
+        return os.path.join(self.cache_dir, f"{name}.fzn"), os.path.join(self.cache_dir, f"{name}.ozn")
+
+    def compile_model(self, model_path: str, dzn_path: str, solver: str, fzn_path: str, ozn_path: str,
+                      window=None) -> bool:
+        """
+        Flatten the model with its data for the solver. The files are written under
+        temporary names and then renamed, so a concurrent run never reads a partial file.
+
+        Returns:
+            True if the model was compiled
+        """
+        window = window or self.window
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_fzn = f"{fzn_path}.{os.getpid()}.{id(self)}.tmp"
+        tmp_ozn = f"{ozn_path}.{os.getpid()}.{id(self)}.tmp"
+
+        process = subprocess.run(
+            [
+                "minizinc",
+                "-c",
+                "-m", model_path,
+                "-d", dzn_path,
+                "--solver", solver,
+                "--fzn", tmp_fzn,
+                "--ozn", tmp_ozn
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            shell=False
+        )
+        if process.returncode != 0:
+            window.print_output(f"MiniZinc compilation failed for model {model_path}:\n{process.stdout}")
+            for path in (tmp_fzn, tmp_ozn):
+                if os.path.exists(path):
+                    os.remove(path)
+            return False
+
+        os.replace(tmp_fzn, fzn_path)
+        os.replace(tmp_ozn, ozn_path)
+        return True
+
+    def run_with_own_data(self, model_path: str, dzn_content: str, solver: str, window=None) -> Dict[str, Any]:
+        """
+        Write the data to a private temporary .dzn file, so that concurrent runs never
+        share one, and run the model on it.
+
+        With the cache enabled the model is flattened once per (model, data, solver) and
+        the FlatZinc is reused by the next runs. The flattening time is then reported
+        apart from the solving time.
+        """
+        flatten_time = None
+        cached = False
+        compiled = False
+        if self.cache:
+            fzn_path, ozn_path = self.flatzinc_paths(model_path, dzn_content, solver)
+            cached = os.path.exists(fzn_path) and os.path.exists(ozn_path)
+            flatten_time = 0.0
+
+        with tempfile.NamedTemporaryFile('w', suffix='.dzn', prefix=f"{self.raw_data}_", delete=False) as f:
+            f.write(dzn_content)
+            dzn_path = f.name
+
+        try:
+            if self.cache and not cached:
+                start = time.time()
+                compiled = self.compile_model(model_path, dzn_path, solver, fzn_path, ozn_path, window)
+                flatten_time = time.time() - start
+
+            if cached or compiled:
+                inputs = [fzn_path, "--ozn-file", ozn_path]
+            else:
+                inputs = ["-m", model_path, "-d", dzn_path]
+            result = self.run_minizinc_model(inputs, solver, window)
+        finally:
+            os.remove(dzn_path)
+
+        # Without the cache the flattening is part of the solving run and is not measured
+        result["flatten_time"] = round(flatten_time, 3) if flatten_time is not None else None
+        result["cached"] = cached
+        return result
 
     def solve(self) -> Dict[str, Any]:
         """
@@ -133,18 +332,16 @@ class CPSolver:
             
             # Read and convert the instance
             m, n, l, s, D = self.read_dat_file(self.data)
-            dzn_content = self.create_dzn_file(m, n, l, s, D)
+            lower_bound, upper_bound, routes = self.compute_bounds(m, n, l, s, D)
+            self.window.print_output(f"Objective bounds: [{lower_bound}, {upper_bound}]")
+            dzn_content = self.create_dzn_file(
+                m, n, l, s, D, lower_bound, upper_bound, routes if self.warm_start else None
+            )
             
             # Generate output filenames
             instance_name = Path(self.raw_data).stem
-            dzn_file = os.path.join(self.output_dir, f"{instance_name}.dzn")
             json_file = os.path.join(self.output_dir, f"{instance_name}.json")
             
-            # Save the .dzn file
-            with open(dzn_file, 'w') as f:
-                f.write(dzn_content)
-            
-            
             # Define the models to run
             models = {
                 "gecode": "MCP_Base_Version.mzn",
@@ -154,21 +351,47 @@ class CPSolver:
                 "chuffed_symmetry": "MCP_LB_SB.mzn",
                 "chuffed_symmetry_heuristic": "MCP_LB_SB_Heuristic_Chuffed.mzn"
             }
+            if self.successor:
+                # Opt-in until the model has been run against MiniZinc on the bundled instances
+                models["gecode_successor"] = "MCP_Successor.mzn"
+                models["chuffed_successor"] = "MCP_Successor.mzn"
+            if self.lns:
+                # Incomplete search: it can only improve the incumbent, never prove optimality
+                models["gecode_successor_lns"] = "MCP_Successor_LNS_Gecode.mzn"
             
-            # Run all models and collect results
-            results = {}
+            jobs = {}
             for model_name, model_file in models.items():
                 model_path = os.path.join(self.models_dir, model_file)
                 if not os.path.exists(model_path):
                     self.window.print_output(f"Error: Model file not found: {model_path}")
                     continue
-                results[model_name] = self.run_minizinc_model(model_path, dzn_file, model_name.split('_')[0])
-            
-            # Remove the .dzn file after it's been used
-            try:
-                os.remove(dzn_file)
-            except Exception as e:
-                pass
+                jobs[model_name] = model_path
+
+            # Run all models and collect results
+            results = {}
+            if self.workers > 1:
+                # The runs are MiniZinc subprocesses, threads are enough to wait for them.
+                # Their messages are buffered and printed here, from the calling thread
+                buffers = {model_name: OutputBuffer() for model_name in jobs}
+                with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    futures = {
+                        pool.submit(
+                            self.run_with_own_data, model_path, dzn_content,
+                            model_name.split('_')[0], buffers[model_name]
+                        ): model_name
+                        for model_name, model_path in jobs.items()
+                    }
+                    for future in as_completed(futures):
+                        model_name = futures[future]
+                        self.window.print_output(f"{model_name} finished")
+                        for message in buffers[model_name].flush():
+                            self.window.print_output(message)
+                        results[model_name] = future.result()
+                results = {model_name: results[model_name] for model_name in jobs}
+
+            else:
+                for model_name, model_path in jobs.items():
+                    results[model_name] = self.run_with_own_data(model_path, dzn_content, model_name.split('_')[0])
 
             # Save results to JSON
             with open(json_file, 'w') as f:
@@ -180,6 +403,17 @@ class CPSolver:
                 self.window.print_output(f"  Time: {result['time']} seconds")
                 self.window.print_output(f"  Optimal: {result['optimal']}")
                 self.window.print_output(f"  Objective: {result['obj']}")
+                self.window.print_output(f"  Status: {result['status']}")
+                if result['cached']:
+                    self.window.print_output("  Flattening: cached")
+                elif result['flatten_time'] is not None:
+                    self.window.print_output(f"  Flattening: {result['flatten_time']} seconds")
+                if result['incumbent_time'] is not None:
+                    self.window.print_output(f"  Incumbent found at: {result['incumbent_time']:.2f} seconds")
+                if len(result['curve']) > 1:
+                    self.window.print_output(
+                        "  Anytime curve: " + ", ".join(f"{obj} at {found}s" for found, obj in result['curve'])
+                    )
                 if result['sol']:
                     self.window.print_output("  Solution paths:")
                     for i, path in enumerate(result['sol']):
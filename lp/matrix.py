@@ -0,0 +1,265 @@
+import os
+import subprocess
+import tempfile
+import numpy as np
+from pulp import PULP_CBC_CMD
+
+
+class MatrixModel:
+    """
+    Sparse MILP built in bulk with NumPy: variables are blocks of columns and constraints
+    are blocks of rows given as arrays of column indices and coefficients, with the same
+    number of terms in every row of a block. The model is written as an MPS file and
+    solved by the CBC or GLPK executable, without any per-variable Python object.
+    """
+
+    def __init__(self, name="MCP_MIP"):
+        self.name = name
+        self.num_cols = 0
+        self.lower = []
+        self.upper = []
+        self.integer = []
+        self.rows = []          # coordinates of the non-zeros
+        self.cols = []
+        self.coefs = []
+        self.senses = []        # one entry per block: sense letter repeated
+        self.rhs = []
+        self.num_rows = 0
+        self.objective = None
+        self.written = None     # columns of the last MPS file, in their order
+        self.start = None       # values of the MIP start, None without one
+
+    def add_variables(self, shape, lower=0, upper=np.inf, integer=False):
+        """
+        Add a block of columns.
+
+        Returns:
+            Array of the column indices, with the given shape
+        """
+        size = int(np.prod(shape))
+        index = np.arange(self.num_cols, self.num_cols + size).reshape(shape)
+        self.num_cols += size
+        self.lower.append(np.broadcast_to(np.asarray(lower, dtype=float), (size,)))
+        self.upper.append(np.broadcast_to(np.asarray(upper, dtype=float), (size,)))
+        self.integer.append(np.full(size, integer))
+        return index
+
+    def add_constraints(self, cols, coefs, sense, rhs):
+        """
+        Add a block of rows: sum(coefs[r] * x[cols[r]]) sense rhs[r] for every row r.
+
+        Args:
+            cols: column indices, shape (rows, terms)
+            coefs: coefficients, broadcastable to cols
+            sense: "L" (<=), "G" (>=) or "E" (==)
+            rhs: right-hand sides, broadcastable to (rows,)
+        """
+        cols = np.asarray(cols)
+        if cols.ndim == 1:
+            cols = cols.reshape(1, -1)
+        count = cols.shape[0]
+        coefs = np.broadcast_to(np.asarray(coefs, dtype=float), cols.shape)
+        self.rows.append(np.repeat(np.arange(self.num_rows, self.num_rows + count), cols.shape[1]))
+        self.cols.append(cols.ravel())
+        self.coefs.append(coefs.ravel())
+        self.senses.append(np.full(count, sense))
+        self.rhs.append(np.broadcast_to(np.asarray(rhs, dtype=float), (count,)))
+        self.num_rows += count
+
+    def set_objective(self, cols, coefs):
+        """
+        Minimize sum(coefs * x[cols]).
+        """
+        self.objective = (np.asarray(cols).ravel(), np.broadcast_to(np.asarray(coefs, dtype=float), np.shape(cols)).ravel())
+
+    def set_start(self, cols, values):
+        """
+        Give a MIP start to the solver: x[cols] = values, the other columns start at 0.
+        """
+        if self.start is None:
+            self.start = np.zeros(self.num_cols)
+        self.start[np.asarray(cols).ravel()] = np.broadcast_to(np.asarray(values, dtype=float), np.shape(cols)).ravel()
+
+    def write_start(self, path):
+        """
+        Write the MIP start as a CBC solution file (the one written by PuLP for its
+        warmStart option): a status line, then "index name value 0" per column of the
+        last MPS file.
+        """
+        with open(path, "w") as f:
+            f.write("Stopped on time - objective value 0\n")
+            f.writelines(
+                f"{index:>7} C{c} {value:>15.12g} {0:>23}\n"
+                for index, (c, value) in enumerate(zip(self.written.tolist(), self.start[self.written].tolist()))
+            )
+
+    def write_mps(self, path):
+        """
+        Write the model as a fixed MPS file (the format written by PuLP, which CBC and
+        GLPK both read): columns C<index>, rows R<index>, at most 8 characters each.
+        """
+        rows = np.concatenate(self.rows)
+        cols = np.concatenate(self.cols)
+        coefs = np.concatenate(self.coefs)
+        keep = coefs != 0
+
+        obj_cols, obj_coefs = self.objective
+        # The objective is the row -1, sorted first within each column
+        rows = np.concatenate([rows[keep], np.full(len(obj_cols), -1)])
+        cols = np.concatenate([cols[keep], obj_cols])
+        coefs = np.concatenate([coefs[keep], obj_coefs])
+        order = np.lexsort((rows, cols))
+        rows, cols, coefs = rows[order], cols[order], coefs[order]
+
+        senses = np.concatenate(self.senses)
+        rhs = np.concatenate(self.rhs)
+        lower = np.concatenate(self.lower)
+        upper = np.concatenate(self.upper)
+        integer = np.concatenate(self.integer)
+
+        with open(path, "w") as f:
+            f.write(f"NAME          {self.name}\nROWS\n N  OBJ\n")
+            f.writelines(f" {sense}  R{r}\n" for r, sense in enumerate(senses.tolist()))
+
+            f.write("COLUMNS\n")
+            # Columns which appear in no row (e.g. fixed self loops) are left out, their
+            # value is 0. The runs of integer ones are enclosed in markers
+            self.written = np.unique(cols)
+            entry_integer = integer[cols]
+            cuts = [0, *(np.flatnonzero(entry_integer[1:] != entry_integer[:-1]) + 1).tolist(), len(cols)]
+            for begin, end in zip(cuts[:-1], cuts[1:]):
+                if entry_integer[begin]:
+                    f.write("    MARK      'MARKER'                 'INTORG'\n")
+                f.writelines(
+                    f"    {'C' + str(c):<8}  {'R' + str(r) if r >= 0 else 'OBJ':<8}  {value:12.12g}\n"
+                    for c, r, value in zip(cols[begin:end].tolist(), rows[begin:end].tolist(), coefs[begin:end].tolist())
+                )
+                if entry_integer[begin]:
+                    f.write("    MARK      'MARKER'                 'INTEND'\n")
+
+            f.write("RHS\n")
+            f.writelines(f"    RHS       {'R' + str(r):<8}  {value:12.12g}\n" for r, value in enumerate(rhs.tolist()) if value != 0)
+
+            f.write("BOUNDS\n")
+            for c, low, up in zip(self.written.tolist(), lower[self.written].tolist(), upper[self.written].tolist()):
+                name = f"C{c}"
+                if low == up:
+                    f.write(f" FX BND       {name:<8}  {low:12.12g}\n")
+                    continue
+                if low != 0:
+                    f.write(f" LO BND       {name:<8}  {low:12.12g}\n" if low != -np.inf else f" MI BND       {name}\n")
+                # Explicit upper bounds, integer columns without one would be binary for some readers
+                f.write(f" UP BND       {name:<8}  {up:12.12g}\n" if up != np.inf else f" PL BND       {name}\n")
+            f.write("ENDATA\n")
+
+    def solve(self, solver_name="cbc", timeout=300, options=()):
+        """
+        Solve the model with the solver executable.
+
+        Args:
+            options: extra command line options of the solver
+
+        Returns:
+            (status, values): status is "optimal", "feasible" or "unknown" (no solution
+            or no answer), values the array of the column values (None without solution)
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            mps_path = os.path.join(tmp, "model.mps")
+            sol_path = os.path.join(tmp, "model.sol")
+            self.write_mps(mps_path)
+
+            if solver_name == "cbc":
+                # GLPK has no MIP start from the command line, it always starts cold
+                if self.start is not None:
+                    mst_path = os.path.join(tmp, "model.mst")
+                    self.write_start(mst_path)
+                    options = ["-mips", mst_path, *options]
+                command = [
+                    PULP_CBC_CMD().path, mps_path,
+                    "-sec", str(timeout), "-timeMode", "elapsed", *options,
+                    "-branch", "-printingOptions", "all", "-solution", sol_path
+                ]
+                reader = self.read_cbc_solution
+            else:
+                command = ["glpsol", "--mps", mps_path, "--tmlim", str(timeout), *options, "--write", sol_path]
+                reader = self.read_glpk_solution
+
+            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if not os.path.exists(sol_path):
+                return "unknown", None
+            status, values = reader(sol_path)
+
+        # The solution is checked against the model, a solver which mixes up its
+        # preprocessing can answer with one that violates some rows
+        if values is not None and not self.is_feasible(values):
+            return "unknown", None
+        return status, values
+
+    def is_feasible(self, values, tolerance=1e-6):
+        """
+        Whether the column values satisfy the bounds, the integrality and all the rows of
+        the model.
+        """
+        lower = np.concatenate(self.lower)
+        upper = np.concatenate(self.upper)
+        if np.any(values < lower - tolerance) or np.any(values > upper + tolerance):
+            return False
+        integer = np.concatenate(self.integer)
+        if np.any(np.abs(values[integer] - np.round(values[integer])) > tolerance):
+            return False
+
+        activity = np.zeros(self.num_rows)
+        np.add.at(activity, np.concatenate(self.rows), np.concatenate(self.coefs) * values[np.concatenate(self.cols)])
+        senses = np.concatenate(self.senses)
+        rhs = np.concatenate(self.rhs)
+        violation = np.where(senses == "L", activity - rhs, np.where(senses == "G", rhs - activity, np.abs(activity - rhs)))
+        return not np.any(violation > tolerance * np.maximum(1, np.abs(rhs)))
+
+    def read_cbc_solution(self, path):
+        """
+        CBC solution file: a status line, then "index name value reduced_cost" per row and
+        per column ("**" marks the infeasible ones).
+        """
+        values = np.zeros(self.num_cols)
+        with open(path) as f:
+            status_line = f.readline()
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                if fields[0] == "**":
+                    fields = fields[1:]
+                if fields[1].startswith("C"):
+                    values[int(fields[1][1:])] = float(fields[2])
+
+        if status_line.startswith("Optimal"):
+            return "optimal", values
+        # Stopped without incumbent, CBC writes the values of the continuous relaxation
+        if "no integer solution" in status_line:
+            return "unknown", None
+        if "objective value" in status_line and not status_line.startswith(("Infeasible", "Integer infeasible")):
+            return "feasible", values
+        return "unknown", None
+
+    def read_glpk_solution(self, path):
+        """
+        GLPK plain text solution (glpsol --write): "s mip rows cols status objective",
+        then one "j column value" line per column.
+        """
+        values = np.zeros(self.num_cols)
+        status = "u"
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if not fields:
+                    continue
+                if fields[0] == "s":
+                    status = fields[4]
+                elif fields[0] == "j":
+                    values[self.written[int(fields[1]) - 1]] = float(fields[2])
+
+        if status == "o":
+            return "optimal", values
+        if status == "f":
+            return "feasible", values
+        return "unknown", None
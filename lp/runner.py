@@ -1,26 +1,56 @@
 import os
 import json
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from multiprocessing import get_context
 from lp.helper import load_all_instances
 from lp.solver import LPSolver
 
-def LPRunner(input_dir, output_dir, solver_name="cbc", first=1, last=21,  use_symmetry_breaking=False, timeout=300, logger=print):
-    os.makedirs(output_dir, exist_ok=True)
-    data = load_all_instances(input_dir, first, last)
+try:
+    import fcntl
+except ImportError:  # Windows: the writes are still atomic, but not locked
+    fcntl = None
+
+
+def result_label(solver_name, use_symmetry_breaking, subtour_elimination="mtz", formulation="three_index", warm_start=False):
+    label = solver_name.lower() + "_symmetry_breaking" if use_symmetry_breaking else solver_name.lower() + "_no_symmetry_breaking"
+    if subtour_elimination != "mtz":
+        label += "_" + subtour_elimination
+    if formulation != "three_index":
+        label += "_" + formulation
+    if warm_start:
+        label += "_warm_start"
+    return label
+
 
-    for filename, (m, n, caps, sizes, D) in data.items():
-        print(f"Solving {filename}")
-        result = LPSolver(
-        m, n, caps, sizes, D,
-        timeout=timeout,
-        solver_name=solver_name,
-        use_symmetry_breaking=use_symmetry_breaking
-        )
+@contextmanager
+def locked(path):
+    """
+    Exclusive lock on path, shared with the other runs writing the same file. The lock
+    file is hidden, as the checker reads every other file of the output folder.
+    """
+    directory, name = os.path.split(path)
+    with open(os.path.join(directory, "." + name + ".lock"), "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
 
-        label = solver_name.lower() + "_symmetry_breaking" if use_symmetry_breaking else solver_name.lower() + "_no_symmetry_breaking"
-        
-        instance_id = "".join(filter(str.isdigit, filename)).zfill(2)
-        out_path = os.path.join(output_dir, f"{instance_id}.json")
 
+def save_result(output_dir, filename, label, result):
+    """
+    Store the result of one configuration under its label in the JSON file of the
+    instance. The file is read and rewritten under its lock, and replaced by rename, so
+    concurrent runs neither lose an update nor leave a partly written file.
+    """
+    instance_id = "".join(filter(str.isdigit, filename)).zfill(2)
+    out_path = os.path.join(output_dir, f"{instance_id}.json")
+
+    with locked(out_path):
         if os.path.exists(out_path):
             with open(out_path, "r") as f:
                 result_dict = json.load(f)
@@ -29,12 +59,71 @@ def LPRunner(input_dir, output_dir, solver_name="cbc", first=1, last=21,  use_sy
 
         result_dict[label] = result
 
-        with open(out_path, "w") as f:
+        with tempfile.NamedTemporaryFile("w", dir=output_dir, prefix=f".{instance_id}.", suffix=".tmp", delete=False) as f:
             json.dump(result_dict, f, indent=2)
-        print(f"Saved to {out_path}")
+        os.replace(f.name, out_path)
+    print(f"Saved to {out_path}")
+
+
+def solve_job(filename, instance, solver_name, use_symmetry_breaking, options):
+    """
+    Solve one instance with one configuration, in the runner or in a pool process.
+
+    Returns:
+        (filename, label, result)
+    """
+    print(f"Solving {filename}")
+    m, n, caps, sizes, D = instance
+    result = LPSolver(
+    m, n, caps, sizes, D,
+    solver_name=solver_name,
+    use_symmetry_breaking=use_symmetry_breaking,
+    **options
+    )
+    if "rounds" in result:
+        print(f"Subtour cuts: {result['cuts']} rows in {result['rounds']} rounds")
+
+    label = result_label(solver_name, use_symmetry_breaking, options["subtour_elimination"], options["formulation"], options["warm_start"])
+    return filename, label, result
+
+
+def LPRunner(input_dir, output_dir, solver_name="cbc", first=1, last=21,  use_symmetry_breaking=False, timeout=300, logger=print, subtour_elimination="mtz", formulation="three_index", warm_start=False, configurations=None, workers=1):
+    """
+    Solve the instances from first to last and store the results in output_dir.
+
+    Args:
+        configurations: list of (solver_name, use_symmetry_breaking) pairs to run on every
+            instance, by default only the one given by solver_name and use_symmetry_breaking
+        workers: with more than one, the (instance, solver, symmetry) jobs run in a pool
+            of processes and each result is stored as soon as it is done
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    data = load_all_instances(input_dir, first, last)
+    if configurations is None:
+        configurations = [(solver_name, use_symmetry_breaking)]
+    options = {
+        "timeout": timeout,
+        "subtour_elimination": subtour_elimination,
+        "formulation": formulation,
+        "warm_start": warm_start
+    }
+    jobs = [
+        (filename, instance, solver, symmetry)
+        for filename, instance in data.items()
+        for solver, symmetry in configurations
+    ]
+
+    if workers <= 1:
+        for job in jobs:
+            save_result(output_dir, *solve_job(*job, options))
+        return
+
+    # The processes are spawned, so they get no copy of the Tk window
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        futures = [pool.submit(solve_job, *job, options) for job in jobs]
+        for future in as_completed(futures):
+            save_result(output_dir, *future.result())
 
 # if __name__ == "__main__":
-#     LPRunner("../input", "../output/lp", first=1, last=10, solver_name="cbc", use_symmetry_breaking=False, timeout=300)
-#     LPRunner("../input", "../output/lp", first=1, last=10, solver_name="cbc", use_symmetry_breaking=True, timeout=300)
-#     LPRunner("../input", "../output/lp", first=1, last=10, solver_name="glpk", use_symmetry_breaking=False, timeout=300)
-#     LPRunner("../input", "../output/lp", first=1, last=10, solver_name="glpk", use_symmetry_breaking=True, timeout=300)
\ No newline at end of file
+#     LPRunner("../input", "../output/lp", first=1, last=10, timeout=300, workers=4,
+#              configurations=[("cbc", False), ("cbc", True), ("glpk", False), ("glpk", True)])
@@ -1,87 +1,381 @@
 import time as pytime
-from pulp import *
+import numpy as np
 from lp.helper import format_output
+from lp.matrix import MatrixModel
+from setup.heuristic import heuristic_solution, route_distance
+from setup.routes import find_subtours, successor_array, trace_route
 
-def LPSolver(m, n, capacities, sizes, distance_matrix, coupled_pairs=None, timeout=300, solver_name="cbc", use_symmetry_breaking=False):
-    model = LpProblem("MCP_MIP", LpMinimize)
+# "mtz": Miller-Tucker-Zemlin constraints, "lazy": subtour cuts added while solving
+SUBTOUR_OPTIONS = ("mtz", "lazy")
 
+# "three_index": arcs x[i][j][k] of each courier, "two_index": arcs y[i][j] shared by the
+# couriers, which are told apart by the assignment of the items
+FORMULATION_OPTIONS = ("three_index", "two_index")
+
+
+def solve_with_subtour_cuts(model, x, depot, solver_name, deadline):
+    """
+    Row generation for the subtour elimination: the model is solved without it, then for
+    each cycle of the solution that does not pass through the depot the cut
+    sum(x[i][j][k] for i != j in the cycle) <= len(cycle) - 1 is added for every courier,
+    and the model is solved again until all the tours start from the depot.
+
+    Returns:
+        (status, values, rounds, cuts): the last solution, without subtours ("unknown"
+        and None if the time ran out before), the number of solves and of added rows
+    """
+    num_nodes, _, m = x.shape
+    rounds = cuts = 0
+    while True:
+        remaining = deadline - pytime.time()
+        if remaining < 1:
+            return "unknown", None, rounds, cuts
+        status, values = model.solve(solver_name, int(remaining))
+        rounds += 1
+        if values is None:
+            return status, values, rounds, cuts
+
+        arcs = values[x] > 0.5
+        subtours = set()
+        for k in range(m):
+            successors = successor_array(np.argwhere(arcs[:, :, k]).tolist(), num_nodes)
+            subtours.update(frozenset(cycle) for cycle in find_subtours(successors, depot))
+        if not subtours:
+            return status, values, rounds, cuts
+        if status != "optimal":
+            # The time ran out on a solution which is not a set of tours
+            return "unknown", None, rounds, cuts
+
+        for subtour in subtours:
+            inside = np.array(sorted(subtour))
+            first, second = np.nonzero(~np.eye(len(inside), dtype=bool))
+            model.add_constraints(x[inside[first], inside[second], :].T, 1, "L", len(inside) - 1)
+            cuts += m
+
+
+def build_three_index_model(model, m, n, capacities, sizes, distances, coupled_pairs, use_symmetry_breaking, subtour_elimination, warm_routes=None):
+    """
+    Three-index formulation: every arc is repeated for every courier.
+
+    Args:
+        warm_routes: routes of a feasible solution (0-based items) given as MIP start
+
+    Returns:
+        x: column indices of the arc variables, shape (n + 1, n + 1, m)
+    """
     num_nodes = n + 1
     depot = n
+    nodes = np.arange(num_nodes)
 
     # Decision Variables
-    x = LpVariable.dicts("x", (range(num_nodes), range(num_nodes), range(m)), cat="Binary")
-    u = LpVariable.dicts("u", (range(n), range(m)), lowBound=0, upBound=n, cat="Integer")
-    courier_weights = [LpVariable(f"weight_{k}", lowBound=0, upBound=capacities[k], cat="Integer") for k in range(m)]
-    courier_distance = [LpVariable(f"dist_{k}", lowBound=0, cat="Continuous") for k in range(m)]
-    D_max = LpVariable("D_max", lowBound=0, cat="Continuous")
+    # x[i][j][k]: courier k travels from i to j, self loops are fixed to 0
+    x_upper = np.ones((num_nodes, num_nodes, m))
+    x_upper[nodes, nodes, :] = 0
+    x = model.add_variables((num_nodes, num_nodes, m), upper=x_upper.ravel(), integer=True)
+    courier_weights = model.add_variables(m, upper=capacities, integer=True)
+    courier_distance = model.add_variables(m)
+    D_max = model.add_variables(1)[0]
 
-    ordering = [LpVariable(f"order_{j}", 1, n, cat="Integer") for j in range(n)]
-    ord_matrix = [[LpVariable(f"ord_{i}_{j}", cat="Binary") for j in range(n)] for i in range(n)]
+    model.set_objective([D_max], 1)  # Objective
 
-    model += D_max  # Objective
-
-    # Constraint 1: Capacity
-    for k in range(m):
-        model += courier_weights[k] == lpSum(x[i][j][k] * sizes[j] for i in range(num_nodes) for j in range(n))
-        model += courier_weights[k] <= capacities[k]
+    # Constraint 1: Capacity (courier_weights[k] <= capacities[k] is its upper bound)
+    model.add_constraints(
+        np.concatenate([courier_weights[:, None], x[:, :n, :].transpose(2, 0, 1).reshape(m, -1)], axis=1),
+        np.concatenate([[1], -np.tile(sizes, num_nodes)]),
+        "E", 0
+    )
 
     # Constraint 2: Each item visited exactly once
-    for j in range(n):
-        model += lpSum(x[i][j][k] for i in range(num_nodes) for k in range(m) if i != j) == 1
+    model.add_constraints(np.stack([x[nodes != j, j, :].ravel() for j in range(n)]), 1, "E", 1)
 
     # Constraint 3: Flow conservation
-    for k in range(m):
-        for j in range(n):
-            model += lpSum(x[i][j][k] for i in range(num_nodes) if i != j) == lpSum(x[j][i][k] for i in range(num_nodes) if i != j)
+    model.add_constraints(
+        np.concatenate([
+            np.concatenate([x[nodes != j, j, :].T, x[j, nodes != j, :].T], axis=1) for j in range(n)
+        ]),
+        np.concatenate([np.ones(n), -np.ones(n)]),
+        "E", 0
+    )
 
     # Constraint 4: Depot entry/exit
-    for k in range(m):
-        model += lpSum(x[depot][j][k] for j in range(n)) == 1
-        model += lpSum(x[j][depot][k] for j in range(n)) == 1
+    model.add_constraints(x[depot, :n, :].T, 1, "E", 1)
+    model.add_constraints(x[:n, depot, :].T, 1, "E", 1)
 
-    # Constraint 5: MTZ Subtour elimination
-    for k in range(m):
-        for i in range(n):
-            for j in range(n):
-                if i != j:
-                    model += u[i][k] - u[j][k] + (n + 1) * x[i][j][k] <= n
+    # Constraint 5: MTZ Subtour elimination (in lazy mode the cuts are added while solving,
+    # starting from the ones of the cycles between two items)
+    if subtour_elimination == "lazy":
+        first, second = np.nonzero(np.triu(~np.eye(n, dtype=bool)))
+        model.add_constraints(
+            np.stack([x[first, second, :].T.ravel(), x[second, first, :].T.ravel()], axis=1), 1, "L", 1
+        )
+    if subtour_elimination == "mtz":
+        u = model.add_variables((n, m), upper=n, integer=True)
+        first, second = np.nonzero(~np.eye(n, dtype=bool))
+        model.add_constraints(
+            np.stack([u[first, :].T.ravel(), u[second, :].T.ravel(), x[first, second, :].T.ravel()], axis=1),
+            [1, -1, n + 1],
+            "L", n
+        )
 
     # Constraint 6: Distance accumulation
-    for k in range(m):
-        model += courier_distance[k] == lpSum(
-            distance_matrix[i][j] * x[i][j][k] for i in range(num_nodes) for j in range(num_nodes) if i != j
-        )
-        model += D_max >= courier_distance[k]
-        
-    # Constraint 7: Coupled items on same courier
-    if coupled_pairs:
-        for i, j in coupled_pairs:
-            for k in range(m):
-                model += lpSum(x[a][i][k] for a in range(num_nodes) if a != i) == \
-                         lpSum(x[a][j][k] for a in range(num_nodes) if a != j)
+    off_diagonal = ~np.eye(num_nodes, dtype=bool)
+    model.add_constraints(
+        np.concatenate([courier_distance[:, None], x[off_diagonal].T], axis=1),
+        np.concatenate([[1], -distances[off_diagonal]]),
+        "E", 0
+    )
+    model.add_constraints(np.stack([np.full(m, D_max), courier_distance], axis=1), [1, -1], "G", 0)
 
-    # Constraint 8: Coupled items ordering
     if coupled_pairs:
-        for i, j in coupled_pairs:
-            model += ordering[i] >= ordering[j] + 1
+        # The ordering permutation only matters for coupled items, it is not built otherwise
+        ordering = model.add_variables(n, lower=1, upper=n, integer=True)
+        ord_matrix = model.add_variables((n, n), upper=1, integer=True)
 
-    # Constraint 9: Ordering uniqueness
-    for i in range(n):
-        model += lpSum(ord_matrix[i][j] for j in range(n)) == 1
-    for j in range(n):
-        model += lpSum(ord_matrix[i][j] for i in range(n)) == 1
-    for i in range(n):
-        model += ordering[i] == lpSum(ord_matrix[i][j] * (j + 1) for j in range(n))
+        # Constraint 7: Coupled items on same courier
+        model.add_constraints(
+            np.concatenate([
+                np.concatenate([x[nodes != i, i, :].T, x[nodes != j, j, :].T], axis=1) for i, j in coupled_pairs
+            ]),
+            np.concatenate([np.ones(n), -np.ones(n)]),
+            "E", 0
+        )
+
+        # Constraint 8: Coupled items ordering
+        model.add_constraints(
+            np.array([[ordering[i], ordering[j]] for i, j in coupled_pairs]), [1, -1], "G", 1
+        )
+
+        # Constraint 9: Ordering uniqueness
+        model.add_constraints(ord_matrix, 1, "E", 1)
+        model.add_constraints(ord_matrix.T, 1, "E", 1)
+        model.add_constraints(
+            np.concatenate([ordering[:, None], ord_matrix], axis=1),
+            np.concatenate([[1], -np.arange(1, n + 1)]),
+            "E", 0
+        )
 
     # Constraint 10: Optional symmetry breaking
+    if use_symmetry_breaking and m > 1:
+        model.add_constraints(np.stack([courier_distance[:-1], courier_distance[1:]], axis=1), [1, -1], "L", 0)
+
+    # Warm start: the arcs, positions, loads and distances of the given routes. With the
+    # symmetry breaking the routes are sorted by distance when the capacities allow it,
+    # otherwise CBC rejects the start
+    if warm_routes is not None:
+        if use_symmetry_breaking:
+            ordered = sorted(warm_routes, key=lambda route: route_distance(route, distances, depot))
+            if all(sizes[route].sum() <= capacities[k] for k, route in enumerate(ordered)):
+                warm_routes = ordered
+        lengths = [route_distance(route, distances, depot) for route in warm_routes]
+        for k, route in enumerate(warm_routes):
+            stops = [depot, *route, depot]
+            model.set_start(x[stops[:-1], stops[1:], k], 1)
+            if subtour_elimination == "mtz":
+                model.set_start(u[route, k], np.arange(1, len(route) + 1))
+        model.set_start(courier_weights, [sizes[route].sum() for route in warm_routes])
+        model.set_start(courier_distance, lengths)
+        model.set_start([D_max], max(lengths))
+
+    return x
+
+
+def three_index_routes(values, x, depot):
+    """
+    Routes of a solution of the three-index formulation: the tour of each courier is
+    reconstructed from its successor array, starting from the depot.
+    """
+    num_nodes, _, m = x.shape
+    arcs = values[x] > 0.5
+    routes = []
+    for k in range(m):
+        successors = successor_array(np.argwhere(arcs[:, :, k]).tolist(), num_nodes)
+        first = successors[depot]
+        routes.append(trace_route(successors, first, depot) if first is not None else [])
+    return routes
+
+
+def build_two_index_model(model, m, n, capacities, sizes, distances, coupled_pairs, use_symmetry_breaking, warm_routes=None):
+    """
+    Two-index formulation: the arcs are not split by courier. Every item is assigned to a
+    courier, the items linked by an arc have the same courier and each courier starts
+    from one of the items reached from the depot. The route lengths are accumulated along
+    the arcs, so there is no distance per courier.
+
+    Args:
+        warm_routes: routes of a feasible solution (0-based items) given as MIP start
+
+    Returns:
+        (y, first): column indices of the arc variables, shape (n + 1, n + 1), and of the
+        first item of each courier, shape (n, m)
+    """
+    num_nodes = n + 1
+    depot = n
+    items = np.arange(n)
+    # No route is longer than the longest arc out of every point
+    longest_route = distances.max(axis=1).sum()
+    # Shortest paths between the points (Floyd-Warshall): any route reaches item i after
+    # at least shortest[depot][i] and needs at least shortest[i][depot] to come back
+    shortest = distances.copy()
+    for k in range(num_nodes):
+        shortest = np.minimum(shortest, shortest[:, k, None] + shortest[None, k, :])
+
+    # Decision Variables
+    # y[i][j]: some courier travels from i to j, self loops are fixed to 0
+    y = model.add_variables((num_nodes, num_nodes), upper=(1 - np.eye(num_nodes)).ravel(), integer=True)
+    assign = model.add_variables((n, m), upper=1, integer=True)
+    first = model.add_variables((n, m), upper=1, integer=True)
+    position = model.add_variables(n, lower=1, upper=n, integer=True)
+    arrival = model.add_variables(n, lower=shortest[depot, :n], upper=longest_route)
+    D_max = model.add_variables(1)[0]
+
+    model.set_objective([D_max], 1)  # Objective
+
+    # Constraint 1: Capacity
+    model.add_constraints(assign.T, sizes, "L", capacities)
+
+    # Constraint 2: Each item entered and left exactly once
+    model.add_constraints(np.stack([y[items[items != j], j].tolist() + [y[depot, j]] for j in range(n)]), 1, "E", 1)
+    model.add_constraints(np.stack([y[j, items[items != j]].tolist() + [y[j, depot]] for j in range(n)]), 1, "E", 1)
+
+    # Constraint 3: Each courier leaves the depot and comes back once
+    model.add_constraints(y[depot, :n], 1, "E", m)
+    model.add_constraints(y[:n, depot], 1, "E", m)
+
+    # Constraint 4: Each item is assigned to one courier
+    model.add_constraints(assign, 1, "E", 1)
+
+    # Constraint 5: The first item of each courier is one reached from the depot and
+    # assigned to it
+    model.add_constraints(first.T, 1, "E", 1)
+    model.add_constraints(np.concatenate([first, y[depot, :n, None]], axis=1), np.concatenate([np.ones(m), [-1]]), "E", 0)
+    model.add_constraints(np.stack([first.ravel(), assign.ravel()], axis=1), [1, -1], "L", 0)
+
+    # Constraint 6: The items linked by an arc have the same courier
+    source, target = np.nonzero(~np.eye(n, dtype=bool))
+    model.add_constraints(
+        np.stack([
+            assign[source, :].T.ravel(), assign[target, :].T.ravel(),
+            np.tile(y[source, target], m), np.tile(y[target, source], m)
+        ], axis=1),
+        [1, -1, 1, 1],
+        "L", 1
+    )
+
+    # Constraint 7: MTZ Subtour elimination on the positions of the items
+    model.add_constraints(np.stack([position[source], position[target], y[source, target]], axis=1), [1, -1, n], "L", n - 1)
+
+    # Constraint 8: Distance accumulation, D_max is reached by the return to the depot
+    model.add_constraints(np.stack([arrival, y[depot, :n]], axis=1), np.stack([np.ones(n), -distances[depot, :n]], axis=1), "G", 0)
+    model.add_constraints(
+        np.stack([arrival[target], arrival[source], y[source, target]], axis=1),
+        np.stack([np.ones(len(source)), -np.ones(len(source)), -(longest_route + distances[source, target])], axis=1),
+        "G", -longest_route
+    )
+    model.add_constraints(np.stack([np.full(n, D_max), arrival], axis=1), [1, -1], "G", shortest[:n, depot])
+    model.add_constraints(
+        np.stack([np.full(n, D_max), arrival, y[:n, depot]], axis=1),
+        np.stack([np.ones(n), -np.ones(n), -(longest_route + distances[:n, depot])], axis=1),
+        "G", -longest_route
+    )
+
+    # Constraint 9: Coupled items on same courier
+    if coupled_pairs:
+        model.add_constraints(
+            np.concatenate([np.stack([assign[i], assign[j]], axis=1) for i, j in coupled_pairs]), [1, -1], "E", 0
+        )
+
+    # Constraint 10: Optional symmetry breaking, the couriers with the same capacity are
+    # sorted by their first item
     if use_symmetry_breaking:
         for k in range(m - 1):
-            model += courier_distance[k] <= courier_distance[k + 1]
+            if capacities[k] == capacities[k + 1]:
+                model.add_constraints(
+                    np.concatenate([first[:, k], first[:, k + 1]]),
+                    np.concatenate([items, -items]),
+                    "L", -1
+                )
+
+    # Warm start: the arcs, assignments and arrival distances of the given routes, the
+    # routes of the couriers with the same capacity being sorted by their first item
+    if warm_routes is not None:
+        warm_routes = list(warm_routes)
+        if use_symmetry_breaking:
+            for k in range(m - 1):
+                for h in range(m - 1 - k):
+                    if capacities[h] == capacities[h + 1] and warm_routes[h][0] > warm_routes[h + 1][0]:
+                        warm_routes[h], warm_routes[h + 1] = warm_routes[h + 1], warm_routes[h]
+        for k, route in enumerate(warm_routes):
+            stops = [depot, *route, depot]
+            model.set_start(y[stops[:-1], stops[1:]], 1)
+            model.set_start(assign[route, k], 1)
+            model.set_start([first[route[0], k]], 1)
+            model.set_start(position[route], np.arange(1, len(route) + 1))
+            model.set_start(arrival[route], np.cumsum(distances[stops[:-2], stops[1:-1]]))
+        model.set_start([D_max], max(route_distance(route, distances, depot) for route in warm_routes))
+
+    return y, first
+
+
+def two_index_routes(values, y, first, depot):
+    """
+    Routes of a solution of the two-index formulation: each courier follows the arcs from
+    its first item until the depot.
+    """
+    arcs = values[y] > 0.5
+    arcs[depot, :] = False
+    successors = successor_array(np.argwhere(arcs).tolist(), len(arcs))
+    routes = []
+    for column in (values[first] > 0.5).T:
+        starts = np.flatnonzero(column)
+        if len(starts) != 1:
+            raise ValueError("The courier has no first item")
+        routes.append(trace_route(successors, int(starts[0]), depot))
+    return routes
+
+
+def LPSolver(m, n, capacities, sizes, distance_matrix, coupled_pairs=None, timeout=300, solver_name="cbc", use_symmetry_breaking=False, subtour_elimination="mtz", formulation="three_index", warm_start=False):
+    if subtour_elimination not in SUBTOUR_OPTIONS:
+        raise ValueError(f"Unknown subtour elimination: {subtour_elimination}")
+    if formulation not in FORMULATION_OPTIONS:
+        raise ValueError(f"Unknown formulation: {formulation}")
+    if formulation == "two_index" and subtour_elimination != "mtz":
+        raise ValueError("The lazy subtour cuts need the three-index formulation")
+
+    # The model is built in bulk as a sparse matrix (see lp/matrix.py): every block of
+    # variables is an array of column indices and every family of constraints is added
+    # at once, instead of one PuLP object per variable and one lpSum per constraint
+    model = MatrixModel("MCP_MIP")
+
+    depot = n
+    sizes = np.asarray(sizes, dtype=float)
+    distances = np.asarray(distance_matrix, dtype=float)
+
+    # The heuristic solution of setup/heuristic.py is the MIP start of CBC (GLPK starts
+    # cold) and the answer when the solver ends without a solution. It ignores the
+    # coupled items, so it is not used with them
+    warm_routes = None
+    if warm_start and not coupled_pairs:
+        heuristic = heuristic_solution(m, n, capacities, sizes, distances)
+        if heuristic is not None and all(heuristic[0]):
+            warm_routes = heuristic[0]
+
+    if formulation == "two_index":
+        y, first = build_two_index_model(model, m, n, capacities, sizes, distances, coupled_pairs, use_symmetry_breaking, warm_routes)
+    else:
+        x = build_three_index_model(model, m, n, capacities, sizes, distances, coupled_pairs, use_symmetry_breaking, subtour_elimination, warm_routes)
 
     # Solve
-    solver = PULP_CBC_CMD(msg=0, timeLimit=timeout) if solver_name == "cbc" else GLPK_CMD(msg=0, timeLimit=timeout)
     start = pytime.time()
-    model.solve(solver)
+    if subtour_elimination == "lazy":
+        status, values, rounds, cuts = solve_with_subtour_cuts(model, x, depot, solver_name, start + timeout)
+    else:
+        status, values = model.solve(solver_name, timeout)
+        remaining = start + timeout - pytime.time()
+        if values is None and solver_name == "cbc" and formulation == "two_index" and remaining >= 1:
+            # On inst05 the preprocessing of CBC 2.10 ends with "Postprocessed model is
+            # infeasible - possible tolerance issue" and an answer which violates the rows,
+            # rejected by MatrixModel.solve: the rest of the time goes to a run without it
+            status, values = model.solve(solver_name, int(remaining), ["-preprocess", "off"])
     end = pytime.time()
 
     raw_seconds = end - start
@@ -91,26 +385,24 @@ def LPSolver(m, n, capacities, sizes, distance_matrix, coupled_pairs=None, timeo
         optimal = False
     else:
         seconds = int(raw_seconds)
-        optimal = model.status == LpStatusOptimal
+        optimal = status == "optimal"
 
     # Extract paths
-    paths = [[] for _ in range(m)]
-    for k in range(m):
-        # Reconstruct tour starting from depot
-        current = depot
-        visited = set()
-        while True:
-            next_node = None
-            for j in range(num_nodes):
-                if j != current and value(x[current][j][k]) == 1:
-                    next_node = j
-                    break
-            if next_node is None or next_node == depot:
-                break
-            if next_node < n:
-                paths[k].append(next_node + 1)
-            visited.add(next_node)
-            current = next_node
+    try:
+        if values is None:
+            raise ValueError("No solution")
+        if formulation == "two_index":
+            routes = two_index_routes(values, y, first, depot)
+        else:
+            routes = three_index_routes(values, x, depot)
+        paths = [[node + 1 for node in route] for route in routes]
+    except ValueError:
+        # Inconsistent arcs, handled as if no solution was found
+        paths = [[] for _ in range(m)]
+    if all(len(p) == 0 for p in paths) and warm_routes is not None:
+        seconds = timeout
+        optimal = False
+        paths = [[node + 1 for node in route] for route in warm_routes]
 
     #if no solution is found, return empty paths
     if all(len(p) == 0 for p in paths):
@@ -118,7 +410,7 @@ def LPSolver(m, n, capacities, sizes, distance_matrix, coupled_pairs=None, timeo
         optimal = False
         obj_val = 0
         sol = []
-        return format_output(seconds, optimal, obj_val, sol)
+        result = format_output(seconds, optimal, obj_val, sol)
     
     else:    
         # Compute actual max distance
@@ -132,4 +424,9 @@ def LPSolver(m, n, capacities, sizes, distance_matrix, coupled_pairs=None, timeo
         obj_val = max(compute_path_distance(p) for p in paths) if any(paths) else 0
         sol  = paths
         
-        return format_output(seconds, optimal, obj_val, sol)
+        result = format_output(seconds, optimal, obj_val, sol)
+
+    if subtour_elimination == "lazy":
+        result["rounds"] = rounds
+        result["cuts"] = cuts
+    return result
@@ -51,9 +51,9 @@ class BinaryModel:
         return corresponding_dict
 
 
-    def binarize(self, instance):
+    def binarize(self, instance, upper_bound=None):
         """
-        Inputs an instance (already parsed).
+        Inputs an instance (already parsed), and optionally a known upper bound of the objective.
 
         Computes:
             Binary-encoded courier capacities
@@ -64,6 +64,9 @@ class BinaryModel:
             load_couriers_bit = max(log2(total load), log2(max capacity))
             distances_bit = log2(max distance)
 
+        When upper_bound is given, no accepted courier distance exceeds it, so distances_bit
+        only has to fit the upper bound and the longest single distance.
+
         Determines whether sub-tour elimination is required:
             sub_tour = True if min(courier_size) >= max(item_size) else False
         """
@@ -83,6 +86,11 @@ class BinaryModel:
                 for i in range(len(distances))]
             ))
         )
+        if upper_bound is not None:
+            distances_bit = min(
+                distances_bit,
+                max(upper_bound, max(max(row) for row in distances)).bit_length()
+            )
 
         # binary representation of courier_size
         courier_size_conv = [self.to_binary(courier_size[i], load_couriers_bit) for i in range(couriers)]
@@ -1,9 +1,10 @@
-from z3.z3 import Bool, If, Or, Not, And, Implies, Xor
+from z3.z3 import Bool, BoolVal, If, Or, Not, And, Implies, Xor, PbLe, PbGe, is_false
 import math
 
 from sat import settings
 
-from sat.utils import to_binary, greater_eq
+from sat.utils import to_binary, greater_eq, convert_from_binary_to_int
+from sat.profiling import profile
 
 
 ############################################################################
@@ -22,8 +23,11 @@ def at_most_one_bw(bool_vars, name):
     :param name: name associated to bool_vars
     :return: And of constraints
     """
-    constraints = []
     n = len(bool_vars)
+    if n <= 1:
+        # Nothing to exclude, e.g. a courier whose arcs were all filtered on capacities
+        return BoolVal(True)
+    constraints = []
     m = math.ceil(math.log2(n))
     r = [Bool(f"r_{name}_{i}") for i in range(m)]
     binaries = [to_binary(i, m) for i in range(n)]
@@ -87,76 +91,267 @@ def binary_increment(a, bit, res, name):
 
     return And(c1, c2, c3)
 
+
+def binary_sum_tree(values, name):
+    """
+    Sums a list of bit-vectors pairwise, level by level, through a balanced tree of
+    binary_sum adders. The depth is log2(len(values)) instead of len(values).
+
+    :param values: list of bit-vectors of z3 variables (or expressions), all of the same length
+    :param name: name associated to the sum
+    :return: (constraints, bit-vector of z3 variables containing the total)
+    """
+    constraints = []
+    bits = len(values[0])
+    level = 0
+    while len(values) > 1:
+        next_values = []
+        for i in range(0, len(values) - 1, 2):
+            res = [Bool(f"{name}_{level}_{i}_{b}") for b in range(bits)]
+            constraints.append(binary_sum(values[i], values[i + 1], res, f"{name}_{level}_{i}"))
+            next_values.append(res)
+        if len(values) % 2:
+            next_values.append(values[-1])
+        values = next_values
+        level += 1
+    return And(constraints), values[0]
+
 ############################################################################
 
 
-def set_constraints(input_data, solver, symmetry=None):
+def capacity_filtering(input_data):
+    """
+    Domain filtering on the capacities, before any variable is created: courier k can
+    carry item i only if s_i <= l_k, and it can travel from item i to item j only if
+    s_i + s_j <= l_k. Depot transitions only need the item to fit.
 
-    if solver is None:
-        raise ValueError("Solver is not initialized")
+    :return: (fits, arcs) where fits[k][i] tells whether courier k can carry item i (the
+             last column tells whether courier k can be used at all) and arcs[k][i][j]
+             whether courier k can travel from i to j (the last index is the depot)
+    """
+    couriers   = input_data[0]
+    items      = input_data[1]
+    capacities = [convert_from_binary_to_int(size) for size in input_data[2]]
+    sizes      = [convert_from_binary_to_int(size) for size in input_data[3]]
 
-    couriers      = input_data[0]
-    items         = input_data[1]
-    couriers_size = input_data[2]
-    item_size     = input_data[3]
-    distances     = input_data[4]
-    loads_bits    = input_data[5]
-    distances_bits = input_data[6]
-    sub_tour      = input_data[7]
+    fits = []
+    for k in range(couriers):
+        row = [sizes[i] <= capacities[k] for i in range(items)]
+        fits.append(row + [any(row)])
 
-    # 1. matrix of assignment
-    # couriers * (items + 1) - last column is the depot
-    asg = [[Bool(f'asg{i}_{j}') for j in range(items + 1)] for i in range(couriers)]
+    for i in range(items):
+        if not any(fits[k][i] for k in range(couriers)):
+            raise ValueError(f"Item {i + 1} does not fit in any courier")
 
-    # 2. matrix of orderings for global visit sequence (n+2)*(n+2)
-    # why 'n+2' ? 1 is for "starting at depot", 1 is for "returning to depot"
-    orderings = [[Bool(f'orderings{i}_{j}') for j in range(items + 2)] for i in range(items + 2)]
+    arcs = []
+    for k in range(couriers):
+        room = [capacities[k] - sizes[i] for i in range(items)] + [capacities[k]]
+        arcs.append([
+            [i != j and fits[k][i] and fits[k][j] and (i == items or j == items or sizes[j] <= room[i])
+             for j in range(items + 1)]
+            for i in range(items + 1)
+        ])
 
-    # 3. matrix of couples, containing travel transitions (n+1)*(n+1)
-    couples = [[Bool(f'couples{i}_{j}') for j in range(items + 1)] for i in range(items + 1)]
+    return fits, arcs
 
-    # 4. matrix of courier loads m*(n+1)*load_bits
-    # courier_loads[i][j] --> The binary cumalative load of the i-th courier after processing j items
-    courier_loads = [[[Bool(f'loads{i}_{j}_{k}') for j in range(loads_bits)] for k in range(items + 1)]
-                        for i in range(couriers)]
+############################################################################
+
+
+def arc_chain_distances(solver, input_data, asg, couples, arcs):
+    """
+    Courier distances accumulated along the (n+1)^2 possible transitions, with one
+    binary_sum per transition and per courier. Transitions the courier can not travel
+    (see capacity_filtering) get no adder.
+
+    :return: list of bit-vectors, the distance travelled by each courier
+    """
+    couriers       = input_data[0]
+    items          = input_data[1]
+    distances      = input_data[4]
+    distances_bits = input_data[6]
 
-    # 5. matrix of courier distances
     # according to couples matrix which was (n+1)*(n+1), we have (n+1)^2+1 possible transitions
     # couriers_distances[k][x] --> The binary cumalative distance of the k-th courier after traveling the x-th possible transition
     couriers_distances = [
         [[Bool(f"dist_{k}_{i}_{j}") for j in range(distances_bits)] for i in range((items + 1) ** 2 + 1)]
         for k in range(couriers)]
 
-    # 6. Sum structures
-    bits_sum = math.ceil(math.log2(items))
-    sum_asg = [[Bool(f'sum_asg{i}_{j}') for i in range(bits_sum)] for j in range(couriers + 1)]
-    sum_first_row = [[Bool(f'sum_start{i}_{j}') for i in range(bits_sum)] for j in range(items + 1)]
-    sum_first_col = [[Bool(f'sum_end{i}_{j}') for i in range(bits_sum)] for j in range(items + 1)]
+    # 1) Initialization of courier distances to zero
+    # 2) Accumulation of distances if courier travels
+    t = 1
+    for k in range(couriers):
+        solver.add(Not(Or(couriers_distances[k][0])))
+        x = 0
+        for i in range(items + 1):
+            for j in range(items + 1):
+                if not arcs[k][i][j]:
+                    couriers_distances[k][x + 1] = couriers_distances[k][x]
+                    x += 1
+                    continue
+                solver.add(
+                    If(
+                        Or(And(couples[i][j], asg[k][j], asg[k][i])),
+                        binary_sum(
+                            couriers_distances[k][x],
+                            distances[i][j],
+                            couriers_distances[k][x + 1],
+                            f'C{t}'
+                        ),
+                        And(
+                            [couriers_distances[k][x][l] == couriers_distances[k][x + 1][l]
+                                for l in range(distances_bits)]
+                        )
+                    )
+                )
+                x += 1
+                t += 1
 
+    return [couriers_distances[k][-1] for k in range(couriers)]
 
 
-    ## Constraints on asg matrix
-    # 1) Each item must be assigned to a courier
-    # Each of the columns in asg matrix, except the last one which is related to depot, must have exactly one True value 
+def successor_tree_distances(solver, input_data, asg, couples, arcs):
+    """
+    Courier distances as the sum of one term per node: every item contributes the
+    distance to its successor if it belongs to the courier, the depot contributes the
+    distance to the first item of the courier. The n+1 terms are summed with
+    binary_sum_tree, so only m*n adders of distances_bits bits are needed. Items the
+    courier can not carry (see capacity_filtering) give no term.
+
+    :return: list of bit-vectors, the distance travelled by each courier
+    """
+    couriers       = input_data[0]
+    items          = input_data[1]
+    distances      = input_data[4]
+    distances_bits = input_data[6]
+
+    def select(literals):
+        return Or(literals) if literals else BoolVal(False)
+
+    # successor_distances[i] --> The binary distance from item i to its successor (shared by the couriers)
+    successor_distances = [[Bool(f"succ_dist_{i}_{b}") for b in range(distances_bits)] for i in range(items)]
     for i in range(items):
-        solver.add(exactly_one_bw([asg[k][i] for k in range(couriers)], name=f'items_{i}'))
+        for b in range(distances_bits):
+            solver.add(
+                successor_distances[i][b] == select(
+                    [couples[i][j] for j in range(items + 1) if not is_false(couples[i][j]) and distances[i][j][b]]
+                )
+            )
 
-    # 2) If a courier carry at least an item, then it must move from depot
+    couriers_distances = []
+    for k in range(couriers):
+        # The depot has one successor per courier, at most one of them is assigned to k
+        terms = [[
+            select([And(couples[-1][j], asg[k][j]) for j in range(items) if arcs[k][-1][j] and distances[-1][j][b]])
+            for b in range(distances_bits)
+        ]]
+        terms += [[And(asg[k][i], successor_distances[i][b]) for b in range(distances_bits)]
+                  for i in range(items) if not is_false(asg[k][i])]
+
+        constraints, courier_distance = binary_sum_tree(terms, f'dist_tree{k}')
+        solver.add(constraints)
+        couriers_distances.append(courier_distance)
+
+    return couriers_distances
+
+
+def binary_adder_loads(solver, input_data, asg, symmetry=None):
+    """
+    Courier loads accumulated item after item with a chain of binary_sum adders,
+    then compared bitwise against the capacities.
+
+    :return: list of bit-vectors, the load carried by each courier
+    """
+    couriers      = input_data[0]
+    items         = input_data[1]
+    couriers_size = input_data[2]
+    item_size     = input_data[3]
+    loads_bits    = input_data[5]
+
+    # matrix of courier loads m*(n+1)*load_bits
+    # courier_loads[i][j] --> The binary cumalative load of the i-th courier after processing j items
+    courier_loads = [[[Bool(f'loads{i}_{j}_{k}') for j in range(loads_bits)] for k in range(items + 1)]
+                        for i in range(couriers)]
+
+    # 1) Initialization of courier loads to zero
+    # 2) Accumulation of loads if courier is assigned to an item
+    t = 1
+    for k in range(couriers):
+        solver.add(Not(Or(courier_loads[k][0])))  # All values are false in index 0
+        for i in range(items):
+            if is_false(asg[k][i]):
+                courier_loads[k][i + 1] = courier_loads[k][i]
+                continue
+            solver.add(If(
+                Not(Or(asg[k][i])),
+                And([courier_loads[k][i][j] == courier_loads[k][i + 1][j] for j in range(loads_bits)]),
+                binary_sum(courier_loads[k][i], item_size[i], courier_loads[k][i + 1], f'sum{t}')
+            ))
+            t += 1
+
+    # 3) Packing capacity constraints
     for k in range(couriers):
         solver.add(
-            If(
-                Or(asg[k][:-1]), asg[k][-1], asg[k][-1] == False
+            greater_eq(
+                couriers_size[k], courier_loads[k][-1], f'bin_packing{k}'
             )
         )
-    
-    # 3) If we are in a sub_tour scenario (all couriers can carry all items), then all couriers must be used
-    solver.add(
-            Implies(
-                sub_tour,
-                And([asg[k][-1] for k in range(couriers)])
+
+    # 4) Symmetry breaking
+    # By enforcing a "load_0 ≥ load_1 ≥ load_2 ...", the solutions which are the same but SAT sees them as different, are eliminated.
+    if symmetry == settings.WITH_SYMMETRY:
+        for k in range(couriers - 1):
+            solver.add(
+                greater_eq(
+                        courier_loads[k][-1], courier_loads[k+1][-1], f'sym_br_{k}'
+                )
             )
-        )
 
+    return [courier_loads[k][-1] for k in range(couriers)]
+
+
+def pseudo_boolean_loads(solver, input_data, asg, symmetry=None):
+    """
+    Courier loads as native z3 pseudo-Boolean constraints over the asg matrix, weighted
+    by the item sizes. No load bit-vector is created, so the returned loads are empty.
+
+    :return: list of empty bit-vectors, one per courier
+    """
+    couriers      = input_data[0]
+    items         = input_data[1]
+    couriers_size = [convert_from_binary_to_int(size) for size in input_data[2]]
+    item_size     = [convert_from_binary_to_int(size) for size in input_data[3]]
+
+    # 1) Packing capacity constraints: sum_i s_i * asg[k][i] <= l_k
+    # (a courier which fits no item has no term left and needs no constraint)
+    for k in range(couriers):
+        terms = [(asg[k][i], item_size[i]) for i in range(items) if not is_false(asg[k][i])]
+        if terms:
+            solver.add(PbLe(terms, couriers_size[k]))
+
+    # 2) Symmetry breaking: load_k - load_k+1 >= 0
+    if symmetry == settings.WITH_SYMMETRY:
+        for k in range(couriers - 1):
+            solver.add(
+                PbGe(
+                    [(asg[k][i], item_size[i]) for i in range(items)] +
+                    [(asg[k + 1][i], -item_size[i]) for i in range(items)],
+                    0
+                )
+            )
+
+    return [[] for _ in range(couriers)]
+
+
+def ordering_matrix_subtours(solver, input_data, couples):
+    """
+    Subtour elimination through a (n+2)*(n+2) permutation matrix of the global visit
+    order: if i travels to j, the one-hot column of i must not be lower than the one of j.
+    """
+    items = input_data[1]
+
+    # matrix of orderings for global visit sequence (n+2)*(n+2)
+    # why 'n+2' ? 1 is for "starting at depot", 1 is for "returning to depot"
+    orderings = [[Bool(f'orderings{i}_{j}') for j in range(items + 2)] for i in range(items + 2)]
 
     ## Constraints on orderings matrix
     # 1) Each column in orderings matrix must have exactly one True value
@@ -173,38 +368,12 @@ def set_constraints(input_data, solver, symmetry=None):
         )
 
 
-    ## Constraints on couples matrix
-    ## The 1st and 2nd consraints below assure each item appears exactly once in a route
-    # 1) Each item must have exactly one outgoing transition to another node
-    for i in range(items):
-        solver.add(exactly_one_bw(couples[i], f'couples_row_{i}'))
-
-    # 2) Each item must have exactly one incoming transition from another node
-    for i in range(items):
-        solver.add(exactly_one_bw([couples[j][i] for j in range(items + 1)], f'couples_col{i}'))
-
-    # 3) No self loop, disallowing a node to travel to itself
-    solver.add(
-            Not(Or(
-                [couples[i][i] for i in range(items + 1)]
-            ))
-        )
-    
-    # 4) Consistency with courier assignment
-    # If we have a transition from i to j, then we must have a courier assigned to both i and j
+    ## Consistency of couples with orderings
     for i in range(items + 1):
         for j in range(items + 1):
-            if i != j:
-                solver.add(
-                    Implies(
-                        couples[i][j],
-                        Or([And(asg[k][i], asg[k][j]) for k in range(couriers)])
-                    )
-                )
+            if is_false(couples[i][j]):
+                continue
 
-    # 5) Consistency with orderings
-    for i in range(items + 1):
-        for j in range(items + 1):
             # If we go from i to the return depot, then node i must appear before the return depot in the tour
             # Also we ensure that the return depot is the last node in the tour
             if j == items:
@@ -235,86 +404,201 @@ def set_constraints(input_data, solver, symmetry=None):
                     )
                 )
 
+
+def binary_position_subtours(solver, input_data, couples):
+    """
+    Subtour elimination through binary-coded positions: every item gets its position in
+    the route on ceil(log2(n+1)) bits, the first item of a route is at position 0 and if
+    i travels to j then pos[j] = pos[i] + 1. A cycle which does not pass through the depot
+    would need at least 2^bits > n items, so it can not exist.
+    """
+    items = input_data[1]
+    position_bits = max(1, math.ceil(math.log2(items + 1)))
+
+    # positions[i] --> The binary position of item i inside its route
+    positions = [[Bool(f'pos{i}_{b}') for b in range(position_bits)] for i in range(items)]
+
+    # next_positions[i] --> positions[i] + 1, computed once per item instead of once per couple
+    next_positions = [[Bool(f'next_pos{i}_{b}') for b in range(position_bits)] for i in range(items)]
+    for i in range(items):
+        solver.add(binary_increment(positions[i], True, next_positions[i], f'pos_inc{i}'))
+
+    for j in range(items):
+        # 1) Leaving the depot the route starts from position 0
+        solver.add(Implies(couples[-1][j], Not(Or(positions[j]))))
+
+        # 2) Travelling from i to j, j is at the position following i
+        for i in range(items):
+            if not is_false(couples[i][j]):
+                solver.add(
+                    Implies(
+                        couples[i][j],
+                        And([positions[j][b] == next_positions[i][b] for b in range(position_bits)])
+                    )
+                )
+
+
+def set_constraints(input_data, solver, symmetry=None, distance_encoding=settings.ARC_CHAIN,
+                    load_encoding=settings.BINARY_ADDER, subtour_encoding=settings.ORDERING_MATRIX,
+                    profiler=None):
+
+    if solver is None:
+        raise ValueError("Solver is not initialized")
+
+    couriers      = input_data[0]
+    items         = input_data[1]
+    couriers_size = input_data[2]
+    item_size     = input_data[3]
+    sub_tour      = input_data[7]
+
+    # 0. Domain filtering on the capacities
+    # the courier-item pairs and the transitions which no capacity allows are fixed to False
+    fits, arcs = capacity_filtering(input_data)
+
+    # 1. matrix of assignment
+    # couriers * (items + 1) - last column is the depot
+    asg = [[Bool(f'asg{i}_{j}') if fits[i][j] else BoolVal(False) for j in range(items + 1)]
+           for i in range(couriers)]
+
+    # An item which fits a single courier is fixed to it
+    for j in range(items):
+        candidates = [i for i in range(couriers) if fits[i][j]]
+        if len(candidates) == 1:
+            asg[candidates[0]][j] = BoolVal(True)
+
+    # 2. matrix of couples, containing travel transitions (n+1)*(n+1)
+    couples = [[Bool(f'couples{i}_{j}') if any(arcs[k][i][j] for k in range(couriers)) else BoolVal(False)
+                for j in range(items + 1)] for i in range(items + 1)]
+
+    # 3. Sum structures
+    bits_sum = math.ceil(math.log2(items))
+    sum_asg = [[Bool(f'sum_asg{i}_{j}') for i in range(bits_sum)] for j in range(couriers + 1)]
+    sum_first_row = [[Bool(f'sum_start{i}_{j}') for i in range(bits_sum)] for j in range(items + 1)]
+    sum_first_col = [[Bool(f'sum_end{i}_{j}') for i in range(bits_sum)] for j in range(items + 1)]
+
+
+
+    ## Constraints on asg matrix
+    profile(profiler, solver, 'asg')
+    # 1) Each item must be assigned to a courier
+    # Each of the columns in asg matrix, except the last one which is related to depot, must have exactly one True value 
+    for i in range(items):
+        solver.add(exactly_one_bw([asg[k][i] for k in range(couriers) if fits[k][i]], name=f'items_{i}'))
+
+    # 2) If a courier carry at least an item, then it must move from depot
+    for k in range(couriers):
+        solver.add(
+            If(
+                Or(asg[k][:-1]), asg[k][-1], asg[k][-1] == False
+            )
+        )
+    
+    # 3) If we are in a sub_tour scenario (all couriers can carry all items), then all couriers must be used
+    solver.add(
+            Implies(
+                sub_tour,
+                And([asg[k][-1] for k in range(couriers)])
+            )
+        )
+
+
+    ## Constraints on couples matrix
+    profile(profiler, solver, 'couples')
+    ## The 1st and 2nd consraints below assure each item appears exactly once in a route
+    # 1) Each item must have exactly one outgoing transition to another node
+    for i in range(items):
+        solver.add(exactly_one_bw([couples[i][j] for j in range(items + 1) if not is_false(couples[i][j])],
+                                  f'couples_row_{i}'))
+
+    # 2) Each item must have exactly one incoming transition from another node
+    for i in range(items):
+        solver.add(exactly_one_bw([couples[j][i] for j in range(items + 1) if not is_false(couples[j][i])],
+                                  f'couples_col{i}'))
+
+    # 3) No self loop, disallowing a node to travel to itself
+    solver.add(
+            Not(Or(
+                [couples[i][i] for i in range(items + 1)]
+            ))
+        )
+    
+    # 4) Consistency with courier assignment
+    # If we have a transition from i to j, then we must have a courier assigned to both i and j
+    for i in range(items + 1):
+        for j in range(items + 1):
+            if not is_false(couples[i][j]):
+                solver.add(
+                    Implies(
+                        couples[i][j],
+                        Or([And(asg[k][i], asg[k][j]) for k in range(couriers) if arcs[k][i][j]])
+                    )
+                )
+
+    # 5) Consistency with the visit order, eliminating the tours disconnected from the depot
+    profile(profiler, solver, 'subtours')
+    if subtour_encoding == settings.ORDERING_MATRIX:
+        ordering_matrix_subtours(solver, input_data, couples)
+
+    elif subtour_encoding == settings.BINARY_POSITIONS:
+        binary_position_subtours(solver, input_data, couples)
+
+    else:
+        raise ValueError(f"Unknown subtour encoding: {subtour_encoding}")
+
     # 6) Consistency with departure from and return to depot for each courier
+    profile(profiler, solver, 'couples')
     for k in range(couriers):
         solver.add(
             # A courier must depart from depot only once, no multi-route 
             at_most_one_bw(
-                        [And(couples[-1][i], asg[k][i]) for i in range(items)],
+                        [And(couples[-1][i], asg[k][i]) for i in range(items) if arcs[k][-1][i]],
                         f'nds_{k}'  
             )
         )
         solver.add(
             # A courier must return once, no duplicate depot visits
             at_most_one_bw(
-                        [And(couples[i][-1], asg[k][i]) for i in range(items)],
+                        [And(couples[i][-1], asg[k][i]) for i in range(items) if arcs[k][i][-1]],
                         f'nde_{k}'  
             )
         )
 
     ## Constraints on courier loads
-    # 1) Initialization of courier loads to zero
-    # 2) Accumulation of loads if courier is assigned to an item
-    t = 1
-    for k in range(couriers):
-        solver.add(Not(Or(courier_loads[k][0])))  # All values are false in index 0
-        for i in range(items):
-            solver.add(If(
-                Not(Or(asg[k][i])),
-                And([courier_loads[k][i][j] == courier_loads[k][i + 1][j] for j in range(loads_bits)]),
-                binary_sum(courier_loads[k][i], item_size[i], courier_loads[k][i + 1], f'sum{t}')
-            ))
-            t += 1
+    profile(profiler, solver, 'loads')
+    # Accumulation, packing capacity and symmetry breaking, encoded according to load_encoding
+    if load_encoding == settings.BINARY_ADDER:
+        courier_loads = binary_adder_loads(solver, input_data, asg, symmetry)
 
-    # 3) Packing capacity constraints
-    for k in range(couriers):
-        solver.add(
-            greater_eq(
-                couriers_size[k], courier_loads[k][-1], f'bin_packing{k}'
-            )
-        )
+    elif load_encoding == settings.PSEUDO_BOOLEAN:
+        courier_loads = pseudo_boolean_loads(solver, input_data, asg, symmetry)
 
-    # 4) Symmetry breaking
-    # By enforcing a "load_0 ≥ load_1 ≥ load_2 ...", the solutions which are the same but SAT sees them as different, are eliminated.
-    if symmetry == settings.WITH_SYMMETRY:
-        for k in range(couriers - 1):
-            solver.add(
-                greater_eq(
-                        courier_loads[k][-1], courier_loads[k+1][-1], f'sym_br_{k}'
-                )
-            )
+    else:
+        raise ValueError(f"Unknown load encoding: {load_encoding}")
+
+    # Redundant: the used couriers must have room for all the items together
+    solver.add(
+        PbGe(
+            [(asg[k][-1], convert_from_binary_to_int(couriers_size[k])) for k in range(couriers) if fits[k][-1]],
+            sum(convert_from_binary_to_int(size) for size in item_size)
+        )
+    )
 
 
     ## Constraints on courier distances
-    # 1) Initialization of courier distances to zero
-    # 2) Accumulation of distances if courier travels
-    t = 1
-    for k in range(couriers):
-        solver.add(Not(Or(couriers_distances[k][0])))
-        x = 0
-        for i in range(items + 1):
-            for j in range(items + 1):
-                solver.add(
-                    If(
-                        Or(And(couples[i][j], asg[k][j], asg[k][i])),
-                        binary_sum(
-                            couriers_distances[k][x],
-                            distances[i][j],
-                            couriers_distances[k][x + 1],
-                            f'C{t}'
-                        ),
-                        And(
-                            [couriers_distances[k][x][l] == couriers_distances[k][x + 1][l]
-                                for l in range(distances_bits)]
-                        )
-                    )
-                )
-                x += 1
-                t += 1
+    profile(profiler, solver, 'distances')
+    # The distance travelled by each courier, encoded according to distance_encoding
+    if distance_encoding == settings.ARC_CHAIN:
+        couriers_distances = arc_chain_distances(solver, input_data, asg, couples, arcs)
+
+    elif distance_encoding == settings.SUCCESSOR_TREE:
+        couriers_distances = successor_tree_distances(solver, input_data, asg, couples, arcs)
+
+    else:
+        raise ValueError(f"Unknown distance encoding: {distance_encoding}")
 
-    
 
     ## Constraints on sum structures
+    profile(profiler, solver, 'sum_structures')
     # 1) Initialization of sum structures to zero
     solver.add(Not(Or(sum_asg[0])))
     solver.add(Not(Or(sum_first_row[0])))
@@ -336,10 +620,11 @@ def set_constraints(input_data, solver, symmetry=None):
     for i in range(bits_sum):
         solver.add(And(sum_first_col[-1][i] == sum_asg[-1][i], sum_first_row[-1][i] == sum_asg[-1][i]))
 
+    profile(profiler, solver)
     
     return  solver, ( 
                         asg,
                         couples,
-                        [courier_loads[k][-1] for k in range(couriers)],
-                        [couriers_distances[k][-1] for k in range(couriers)]
+                        courier_loads,
+                        couriers_distances
                     )
\ No newline at end of file
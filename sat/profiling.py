@@ -0,0 +1,75 @@
+import time as t
+
+from z3.z3 import And
+
+from sat.utils import variable_ids
+
+
+class ModelProfiler:
+    """
+    Collects, for each group of constraints of the SAT model, the wall time spent building
+    it, the Boolean variables it introduces and the assertions it adds, and for each
+    check() call its status, time and the z3 statistics.
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self.checks = []
+        self.current = None
+        self.seen = set()
+
+    def mark(self, solver, group=None):
+        """
+        Closes the running group and opens a new one. A group opened more than once
+        is accumulated.
+
+        :param solver: solver the constraints are added to
+        :param group: name of the group to open, None only closes the running one
+        """
+        now = t.time()
+        assertions = solver.assertions()
+
+        if self.current is not None:
+            name, start, start_assertions = self.current
+            added = [assertions[i] for i in range(start_assertions, len(assertions))]
+            ids = variable_ids(And(added)) if added else set()
+            created = ids - self.seen
+            self.seen |= ids
+
+            stats = self.groups.setdefault(name, {'time': 0.0, 'variables': 0, 'assertions': 0})
+            stats['time'] += now - start
+            stats['variables'] += len(created)
+            stats['assertions'] += len(added)
+
+        # the counting above is not part of the next group
+        self.current = (group, t.time(), len(assertions)) if group is not None else None
+
+    def record_check(self, status, seconds, statistics, **info):
+        """
+        :param status: result of the check
+        :param seconds: wall time of the check
+        :param statistics: z3 statistics of the solver after the check
+        :param info: other values describing the check (e.g. the bound)
+        """
+        check = dict(info)
+        check['status'] = str(status)
+        check['time'] = seconds
+        check['statistics'] = {key: statistics.get_key_value(key) for key in statistics.keys()}
+        self.checks.append(check)
+
+    def report(self):
+        """
+        :return: dictionary {groups: checks:} which can be saved in the result json
+        """
+        return {
+            'groups': self.groups,
+            'checks': self.checks
+        }
+
+
+def profile(profiler, solver, group=None):
+    """
+    Shortcut for profiler.mark, doing nothing when profiling is disabled
+    """
+    if profiler is not None:
+        profiler.mark(solver, group)
@@ -0,0 +1,39 @@
+import time as t
+
+
+class Deadline:
+    """
+    Wall-clock budget of a configuration, shared by model building and by every check()
+    call, so that the whole configuration ends within the timeout.
+    """
+
+    def __init__(self, budget, reserve=0.0):
+        """
+        :param budget: seconds available from now
+        :param reserve: seconds kept aside at the end, e.g. to decode the final model
+        """
+        self.budget = budget
+        self.reserve = reserve
+        self.start = t.time()
+        self.end = self.start + budget
+
+    def elapsed(self):
+        """
+        :return: seconds elapsed since the beginning of the budget
+        """
+        return t.time() - self.start
+
+    def remaining(self):
+        """
+        :return: seconds which can still be given to the solver (the reserve excluded)
+        """
+        return self.end - self.reserve - t.time()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def overrun(self):
+        """
+        :return: seconds spent beyond the budget, 0 if the budget was respected
+        """
+        return max(0.0, t.time() - self.end)
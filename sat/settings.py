@@ -2,11 +2,17 @@
 
 LINEAR_SEARCH = "linear_search"
 BINARY_SEARCH = "binary_search"
+HYBRID_SEARCH = "hybrid_search"         # bottom-up lower bounds interleaved with top-down incumbents
 SEARCH_OPTIONS = [
     LINEAR_SEARCH,
-    BINARY_SEARCH
+    BINARY_SEARCH,
+    HYBRID_SEARCH
     ]
 
+# Seconds given to the first check of each track of the hybrid search, doubled every time
+# the track runs out of its slice without an answer
+HYBRID_TIME_SLICE = 1.0
+
 
 NO_SYMMETRY = "no_symmetry"
 WITH_SYMMETRY = "with_symmetry"           
@@ -15,3 +21,40 @@ SYMMETRY_OPTIONS = [
     WITH_SYMMETRY
     ]
 
+
+# Encodings of the courier distances
+ARC_CHAIN = "arc_chain"                 # one adder per possible arc (n+1)^2
+SUCCESSOR_TREE = "successor_tree"       # one term per node, summed by a balanced adder tree
+DISTANCE_ENCODINGS = [
+    ARC_CHAIN,
+    SUCCESSOR_TREE
+    ]
+
+
+# Encodings of the courier loads
+BINARY_ADDER = "binary_adder"           # chain of binary adders and bitwise capacity check
+PSEUDO_BOOLEAN = "pseudo_boolean"       # native z3 pseudo-Boolean constraints (PbLe)
+LOAD_ENCODINGS = [
+    BINARY_ADDER,
+    PSEUDO_BOOLEAN
+    ]
+
+
+# Encodings of the subtour elimination
+ORDERING_MATRIX = "ordering_matrix"     # (n+2)*(n+2) permutation matrix of the visit order
+BINARY_POSITIONS = "binary_positions"   # log2(n+1) bits position of each item in its route
+SUBTOUR_ENCODINGS = [
+    ORDERING_MATRIX,
+    BINARY_POSITIONS
+    ]
+
+
+# Z3 solver back-ends, as chains of tactics (None is the plain Solver() with its own strategy)
+DEFAULT_SOLVER = "default"              # z3 Solver(), incremental, automatic strategy
+BIT_BLAST_SAT = "bit_blast_sat"         # simplify -> propagate-values -> bit-blast -> sat
+CNF_SAT = "cnf_sat"                     # simplify -> propagate-values -> tseitin-cnf -> sat
+TACTIC_PIPELINES = {
+    DEFAULT_SOLVER: None,
+    BIT_BLAST_SAT: ["simplify", "propagate-values", "bit-blast", "sat"],
+    CNF_SAT: ["simplify", "propagate-values", "tseitin-cnf", "sat"]
+    }
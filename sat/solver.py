@@ -1,32 +1,134 @@
 from sat import settings
 
-from z3.z3 import Solver, sat, unsat, Bool, Z3Exception
+from z3.z3 import Solver, Then, set_param, sat, unsat, unknown, Bool, And, Implies, Not, Z3Exception, is_true
 
 from sat.utils import (
     set_upper_bound, to_binary, set_lower_bound, greater_eq, max_of_bin_int,
-    convert_from_binary_to_int, sorting_correspondence, saving_file
+    convert_from_binary_to_int, sorting_correspondence, saving_file, count_variables,
+    count_clauses, count_expressions
     )
 from sat.binarization import binarizer
 
 from sat.constraints import set_constraints
+from sat.profiling import ModelProfiler, profile
+from sat.scheduling import Deadline
 
-from setup.config import glob
+from setup.config import glob, OutputBuffer
+from setup.routes import successor_array, trace_route
+from setup.heuristic import heuristic_solution
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
 
 import time as t
 
 
+def init_worker():
+    """
+    Initializer of the pool processes: they have no GUI, so their messages are buffered
+    and sent back to the main process.
+    """
+    glob.add('app', OutputBuffer())
+
+
+def solve_configuration_worker(instance, search_opt, symm_opt, output_dir, timeout, options):
+    """
+    Runs a single configuration in a pool process.
+
+    :return: (key of the configuration, solution, messages printed while solving)
+    """
+    solver = SATSolver({}, output_dir, timeout, **options)
+    solution_key_dict, solution = solver.solve_configuration(instance, search_opt, symm_opt)
+    return solution_key_dict, solution, solver.window.flush()
+
+
 class SATSolver:
-    def __init__(self, data, output_dir, timeout):
+    def __init__(self, data, output_dir, timeout, distance_encoding=settings.ARC_CHAIN,
+                 load_encoding=settings.BINARY_ADDER, subtour_encoding=settings.ORDERING_MATRIX, workers=1,
+                 profile=False, decoding_reserve=0.0, heuristic_bound=True, tactic=settings.DEFAULT_SOLVER,
+                 threads=1, seed=None):
         self.data = data
         self.output_dir = output_dir
         self.timeout = timeout
+        self.distance_encoding = distance_encoding
+        self.load_encoding = load_encoding
+        self.subtour_encoding = subtour_encoding
+        self.workers = workers
+        self.profile = profile
+        self.profiler = None
+        self.decoding_reserve = decoding_reserve
+        self.heuristic_bound = heuristic_bound
+        if tactic not in settings.TACTIC_PIPELINES:
+            raise ValueError(f"Unknown tactic pipeline: {tactic}")
+        self.tactic = tactic
+        self.threads = threads
+        self.seed = seed
+        self.deadline = None
+        self.overrun = 0.0
         self.solver = None
         self.symmetry = None
+        self.probe_stats = []
         self.window = glob.obtain('app')
 
     def set_solver(self):
-        self.solver = Solver()
+        """
+        Creates the solver of a configuration from the selected tactic pipeline, the number
+        of threads and the random seed.
+        """
+        # Parallel mode and seeds are global z3 parameters, so they are set again for every
+        # configuration (a sequential run would otherwise inherit them from the previous one)
+        set_param('parallel.enable', self.threads > 1)
+        set_param('parallel.threads.max', self.threads)
+        set_param('sat.threads', self.threads)
+        set_param('sat.random_seed', self.seed or 0)
+        set_param('smt.random_seed', self.seed or 0)
+
+        pipeline = settings.TACTIC_PIPELINES[self.tactic]
+        self.solver = Then(*pipeline).solver() if pipeline else Solver()
         self.solver.set('timeout', self.timeout * 1000)
+        if self.seed is not None:
+            self.solver.set('random_seed', self.seed)
+
+    def check(self, *assumptions, budget=None, **info):
+        """
+        Runs solver.check within the remaining budget of the deadline, recording the time
+        and the z3 statistics of the call when profiling.
+
+        :param assumptions: literals assumed for this call only
+        :param budget: optional time limit of this call in seconds
+        :param info: values describing the check in the profile (e.g. the bound)
+        """
+        # Each check only gets what is left of the configuration budget
+        remaining = self.deadline.remaining()
+        if remaining <= 0:
+            return unknown
+        if budget is not None:
+            remaining = min(remaining, budget)
+        self.solver.set('timeout', max(1, int(remaining * 1000)))
+
+        start = t.time()
+        status = self.solver.check(*assumptions)
+        if self.profiler is not None:
+            self.profiler.record_check(status, t.time() - start, self.solver.statistics(), **info)
+        return status
+
+    def heuristic_upper_bound(self, instance):
+        """
+        Objective of a fast feasible solution (greedy assignment and nearest neighbour
+        routes), used as initial upper bound and to size the distance bit-vectors.
+
+        :return: the upper bound, None if disabled or if the heuristic finds no solution
+        """
+        if not self.heuristic_bound:
+            return None
+
+        heuristic = heuristic_solution(*instance)
+        if heuristic is None:
+            return None
+
+        _, upper_bound = heuristic
+        self.window.print_output(f"Heuristic upper bound: {upper_bound}")
+        return upper_bound
 
     def initiate_searching(self, instance, search_opt):
         if search_opt == settings.LINEAR_SEARCH:
@@ -35,9 +137,85 @@ class SATSolver:
         elif search_opt == settings.BINARY_SEARCH:
             return self.binary_search(instance)
 
+        elif search_opt == settings.HYBRID_SEARCH:
+            return self.hybrid_search(instance)
+
         raise ValueError(f"Unknown search option: {search_opt}")
 
+    def solution_key(self, search_opt, symm_opt):
+        """
+        :return: the key of the configuration in the output json, the encodings and the
+                 solver settings are appended only when they differ from the default ones
+        """
+        key = f"z3_{symm_opt}_{search_opt}"
+        if self.distance_encoding != settings.ARC_CHAIN:
+            key += f"_{self.distance_encoding}"
+        if self.load_encoding != settings.BINARY_ADDER:
+            key += f"_{self.load_encoding}"
+        if self.subtour_encoding != settings.ORDERING_MATRIX:
+            key += f"_{self.subtour_encoding}"
+        if self.tactic != settings.DEFAULT_SOLVER:
+            key += f"_{self.tactic}"
+        if self.threads > 1:
+            key += f"_{self.threads}threads"
+        if self.seed is not None:
+            key += f"_seed{self.seed}"
+        return key
+
+    def solve_configuration(self, instance, search_opt, symm_opt):
+        """
+        Runs a single search/symmetry configuration on an instance.
+
+        :return: (key of the configuration, dictionary {time: optimal: obj: sol:})
+        """
+        self.window.print_output(f"### Search: {search_opt}, Symmetry: {symm_opt} ###")
+        solution_key_dict = self.solution_key(search_opt, symm_opt)
+        self.symmetry = symm_opt
+        self.probe_stats = []
+        self.profiler = ModelProfiler() if self.profile else None
+        self.deadline = Deadline(self.timeout, self.decoding_reserve)
+        self.set_solver()
+
+        try:
+            solution = self.initiate_searching(instance, search_opt)
+            print(solution)
+
+        except TimeoutError as e:
+            print("TimeoutError:", e)
+            solution = {
+                        'time': self.timeout,
+                        'optimal': False,
+                        'obj': "n/a",
+                        'sol': []
+                    }
+
+        except Z3Exception as e:
+            print("Z3 Exception:", e)
+            solution = {
+                        'time': self.timeout,
+                        'optimal': False,
+                        'obj': "n/a",
+                        'sol': []
+                    }
+
+        except Exception as e:
+            print("Exception:", e)
+            solution = {'satisfiable':False}
+
+        self.overrun = self.deadline.overrun()
+        if self.overrun > 0:
+            self.window.print_output(f"Deadline overrun: {self.overrun:.2f} seconds")
+
+        if self.profiler is not None:
+            solution['profile'] = self.profiler.report()
+            solution['profile']['probes'] = self.probe_stats
+            solution['profile']['overrun'] = self.overrun
+
+        return solution_key_dict, solution
+
     def solve(self):
+        if self.workers > 1:
+            return self.solve_parallel()
 
         path_to_save = self.output_dir + "/sat/"
         for key, instance in self.data.items():
@@ -47,66 +225,113 @@ class SATSolver:
 
             for search_opt in settings.SEARCH_OPTIONS:
                 for symm_opt in settings.SYMMETRY_OPTIONS:
-                    self.window.print_output(f"### Search: {search_opt}, Symmetry: {symm_opt} ###")
-                    solution_key_dict = f"z3_{symm_opt}_{search_opt}"
-                    self.symmetry = symm_opt
-                    self.set_solver()
-
-                    try:
-                        solution = self.initiate_searching(instance, search_opt)
-                        print(solution)
-                        solutions_dict[solution_key_dict] = solution
-                    
-                    except TimeoutError as e:
-                        print("TimeoutError:", e)
-                        solutions_dict[solution_key_dict] = {
-                                    'time': self.timeout,
-                                    'optimal': False,
-                                    'obj': "n/a",
-                                    'sol': []
-                                }
-
-                    except Z3Exception as e:
-                        print("Z3 Exception:", e)
-                        solutions_dict[solution_key_dict] = {
-                                    'time': self.timeout,
-                                    'optimal': False,
-                                    'obj': "n/a",
-                                    'sol': []
-                                }
-                    
-                    except Exception as e:
-                        print("Exception:", e)
-                        solutions_dict[solution_key_dict] = {'satisfiable':False}
+                    solution_key_dict, solution = self.solve_configuration(instance, search_opt, symm_opt)
+                    solutions_dict[solution_key_dict] = solution
 
             saving_file(solutions_dict, path_to_save, output_filename)
 
             
             self.window.print_output(f"###### Instance: {key} ended ######")
 
+    def solve_parallel(self):
+        """
+        Runs every (instance, search, symmetry) configuration in a pool of self.workers
+        processes. The processes are spawned, so each of them has its own Z3 context.
+        An instance is saved as soon as all its configurations are done.
+        """
+        path_to_save = self.output_dir + "/sat/"
+        options = {
+            'distance_encoding': self.distance_encoding,
+            'load_encoding': self.load_encoding,
+            'subtour_encoding': self.subtour_encoding,
+            'profile': self.profile,
+            'decoding_reserve': self.decoding_reserve,
+            'heuristic_bound': self.heuristic_bound,
+            'tactic': self.tactic,
+            'threads': self.threads,
+            'seed': self.seed
+        }
+        configurations = [(search_opt, symm_opt) for search_opt in settings.SEARCH_OPTIONS
+                                                 for symm_opt in settings.SYMMETRY_OPTIONS]
+        order = [self.solution_key(search_opt, symm_opt) for search_opt, symm_opt in configurations]
+
+        solutions = {key: {} for key in self.data}
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'),
+                                 initializer=init_worker) as pool:
+            jobs = {}
+            for key, instance in self.data.items():
+                for search_opt, symm_opt in configurations:
+                    future = pool.submit(
+                        solve_configuration_worker,
+                        instance, search_opt, symm_opt, self.output_dir, self.timeout, options
+                    )
+                    jobs[future] = key
+
+            for future in as_completed(jobs):
+                key = jobs[future]
+                solution_key_dict, solution, messages = future.result()
+                if not solutions[key]:
+                    self.window.print_output(f"###### Instance: {key} ######")
+                for message in messages:
+                    self.window.print_output(message)
+                solutions[key][solution_key_dict] = solution
+
+                if len(solutions[key]) == len(configurations):
+                    output_filename = key.split('.')[0][-2:] + '.json'
+                    solutions_dict = {k: solutions[key][k] for k in order}
+                    saving_file(solutions_dict, path_to_save, output_filename)
+                    self.window.print_output(f"###### Instance: {key} ended ######")
+
     def get_solution(self, model, results):
-        asg, couples, couriers_load, couriers_distance = results
+        """
+        Decodes asg, couples, loads and distances from the model, completing the variables
+        left unassigned by z3.
+
+        :return: the components of results with Python booleans in place of z3 variables
+        """
+        return tuple(
+            [[is_true(model.evaluate(var, model_completion=True)) for var in vector] for vector in component]
+            for component in results
+        )
+
+    def final_solution(self, model, results, correspondence_dict, optimal, seconds):
+        """
+        Full decoding of the model, done only once for the answer of the search.
+
+        :return: a dictionary {time: optimal: obj: sol:}
+        """
+        evaluation = self.get_solution(model, results)
+        final_evaluation = [sorting_correspondence(res, correspondence_dict)
+                            for res in evaluation]
+        self.print_solution(final_evaluation, round(seconds, 3), optimal=optimal)
+        return self.format_output(final_evaluation, optimal, seconds)
+
+    def routes(self, asg, couples):
+        """
+        :param asg: decoded assignment matrix
+        :param couples: decoded couples matrix
+        :return: for each courier the list of the items it visits (0-based), empty if unused
+        """
         couriers = len(asg)
         items = len(asg[0]) - 1
-        # calculating bits
-        load_couriers_bit = len(couriers_load[0])
-        distances_bit = len(couriers_distance[0])
 
-        asg_evaluated = [[model.evaluate(asg[k][i]) for i in range(items + 1)] for k in range(couriers)]
+        # Each item has exactly one successor, shared by all the couriers
+        successors = successor_array(
+            ((i, j) for i in range(items) for j in range(items + 1) if couples[i][j]),
+            items + 1
+        )
 
-        couples_evaluated = [[model.evaluate(couples[k][i]) for i in range(items + 1)]
-                            for k in range(items + 1)]
-
-        courier_loads_evaluated = [
-            [model.evaluate(couriers_load[k][j]) for j in range(load_couriers_bit)]
-            for k in range(couriers)]
+        all_routes = []
+        for k in range(couriers):
+            route = []
+            if asg[k][items]:   # if courier is used (assigned to depot)
+                # first item courier k visits: there's a transition depot → item i and courier k is responsible
+                first = next((i for i in range(items) if couples[items][i] and asg[k][i]), None)
+                route = trace_route(successors, first, items)
+            all_routes.append(route)
 
-        couriers_distances_evaluated = [
-            [model.evaluate(couriers_distance[k][j])for j in range(distances_bit)]
-            for k in range(couriers)]
+        return all_routes
 
-        return asg_evaluated, couples_evaluated, courier_loads_evaluated, couriers_distances_evaluated
-    
     def format_output(self, result, opt, seconds):
         """
         :param solution: solution of the model
@@ -116,34 +341,10 @@ class SATSolver:
         """
         asg, couples, _, distances = result
         couriers = len(asg)
-        items = len(asg[0]) - 1
         seconds = int(seconds).__floor__()
         optimal = opt
         obj = int(max([convert_from_binary_to_int(distances[i]) for i in range(couriers)]))
-        all_dist = []
-        var = 0
-        for k in range(couriers):
-            courier_path = []
-            if asg[k][items]:   # if courier is used (assigned to depot)
-                for i in range(items + 1):
-                    if couples[items][i] and asg[k][i]:  # there's a transition: depot → item i and courier k is responsible
-                        var = i  # first item i courier k visits
-                        break
-
-                # tracing the tour
-                found = True
-                while found:
-                    for j in range(items + 1):
-                        if couples[var][j] and asg[k][j]:
-
-                            # stops when reaching depot
-                            if j == items:
-                                courier_path.append(var+1)
-                                found = False
-                            else:
-                                courier_path.append(var+1)
-                                var = j
-            all_dist.append(courier_path)
+        all_dist = [[i + 1 for i in route] for route in self.routes(asg, couples)]
 
         return  {
             'time': seconds if seconds < self.timeout else self.timeout,
@@ -163,25 +364,12 @@ class SATSolver:
         couriers = len(asg_evaluated)
         items = len(asg_evaluated[0]) - 1
 
-        for k in range(couriers):
+        for k, route in enumerate(self.routes(asg_evaluated, couples_evaluated)):
             self.window.print_output(f"Courier {k}")
             if asg_evaluated[k][items]:
-                for i in range(items + 1):
-                    if couples_evaluated[items][i] and asg_evaluated[k][i]:
-                        self.window.print_output(f"  start: ORIGIN → end: Item {i}")
-                        var = i
-                        break  # Stop after first start point is found
-
-                found = True
-                while found:
-                    for j in range(items + 1):
-                        if couples_evaluated[var][j] and asg_evaluated[k][j]:
-                            if j == items:
-                                self.window.print_output(f"  start: Item {var} → end: ORIGIN")
-                                found = False
-                            else:
-                                self.window.print_output(f"  start: Item {var} → end: Item {j}")
-                                var = j
+                stops = ["ORIGIN"] + [f"Item {i}" for i in route] + ["ORIGIN"]
+                for start, end in zip(stops[:-1], stops[1:]):
+                    self.window.print_output(f"  start: {start} → end: {end}")
             else:
                 self.window.print_output("  DO NOT START")
 
@@ -194,48 +382,112 @@ class SATSolver:
             self.window.print_output(f"Time: {int(seconds).__floor__()} seconds")
         self.window.print_output(f"Optimal: {'Yes' if optimal else 'No'}")
 
-    def linear_search(self, instance):
-        self.window.print_output("Starting optimization exploiting linear search")
+    def set_objective(self, results, couriers, distance_bits, lower_bound):
+        """
+        Encodes the objective "maximum of the courier distances" a single time.
+        Bounds on the objective are then attached through bound_literal, so the
+        network is shared by every iteration of the search.
+
+        :param results: tuple returned by set_constraints
+        :param couriers: number of couriers
+        :param distance_bits: number of bits used for the distances
+        :param lower_bound: integer lower bound of the objective
+        :return: bit-vector of z3 variables holding the maximum distance
+        """
+        max_val = [[Bool(f"max_{j}_{i}") for i in range(distance_bits)]
+                                         for j in range(couriers)]
+        self.solver.add(
+            max_of_bin_int(
+                    [results[-1][k] for k in range(couriers)],
+                    max_val,
+                    'max_obj'
+                )
+        )
+        lower_bound = min(lower_bound, 2 ** distance_bits - 1)
+        self.solver.add(greater_eq(max_val[-1], to_binary(lower_bound, distance_bits), "low_bound"))
+
+        return max_val[-1]
+
+    def objective_bounds(self, objective, upper_bound, name, lower_bound=None):
+        """
+        :param objective: bit-vector of the objective returned by set_objective
+        :param upper_bound: integer upper bound
+        :param name: name associated to the bounds
+        :param lower_bound: optional integer lower bound
+        :return: constraints which are true if lower_bound <= objective <= upper_bound
+        """
+        distance_bits = len(objective)
+        upper_bound = min(upper_bound, 2 ** distance_bits - 1)
+        constraints = [greater_eq(to_binary(upper_bound, distance_bits), objective, f"up_{name}")]
+        if lower_bound is not None:
+            lower_bound = min(lower_bound, 2 ** distance_bits - 1)
+            constraints.append(greater_eq(objective, to_binary(lower_bound, distance_bits), f"low_{name}"))
+        return And(constraints)
+
+    def bound_literal(self, objective, bound, name):
+        """
+        Adds the guarded constraint "act -> objective <= bound" and returns the
+        activation literal act, to be passed to check() as an assumption.
 
-        input_data, correspondence_dict = binarizer.binarize(instance)
+        :param objective: bit-vector of the objective returned by set_objective
+        :param bound: integer upper bound
+        :param name: name associated to the bound
+        :return: the activation literal
+        """
+        act = Bool(f"act_{name}")
+        self.solver.add(Implies(act, self.objective_bounds(objective, bound, name)))
+        return act
+
+    def build_model(self, instance):
+        """
+        Binarizes the instance, encodes its constraints and the objective network, which is
+        built once: the searches only attach bounds to it.
+
+        :return: (input_data, correspondence_dict, results, objective, lower_bound, upper_bound)
+        """
+        profile(self.profiler, self.solver, 'binarize')
+        upper_bound = self.heuristic_upper_bound(instance)
+        input_data, correspondence_dict = binarizer.binarize(instance, upper_bound)
         couriers = input_data[0]
         distance_bits = input_data[6]
 
-        upper_bound = set_upper_bound(instance[4], input_data[-1], couriers)
-        self.solver, results = set_constraints(input_data, self.solver, self.symmetry)
+        lower_bound = set_lower_bound(instance[4], input_data[-1])[0]
+        if upper_bound is None:
+            upper_bound = set_upper_bound(instance[4], input_data[-1], couriers)
+
+        self.solver, results = set_constraints(
+            input_data, self.solver, self.symmetry,
+            distance_encoding=self.distance_encoding, load_encoding=self.load_encoding,
+            subtour_encoding=self.subtour_encoding, profiler=self.profiler
+        )
+
+        profile(self.profiler, self.solver, 'objective')
+        objective = self.set_objective(results, couriers, distance_bits, lower_bound)
+        profile(self.profiler, self.solver)
         self.window.print_output('Model built, starting optimization process search')
 
+        return input_data, correspondence_dict, results, objective, lower_bound, upper_bound
+
+    def linear_search(self, instance):
+        self.window.print_output("Starting optimization exploiting linear search")
+
+        # Each new upper bound is enforced through an activation literal passed as an assumption
+        input_data, correspondence_dict, results, objective, _, upper_bound = self.build_model(instance)
+        distance_bits = input_data[6]
+
         model = None
-        output_dict = None
         optimal = False
         satisfiable = True
         iter = 0
-        start_time = t.time()
 
         while satisfiable:
-            # The bounds
-            conv_upper_bound = to_binary(upper_bound, distance_bits)
-            lower_bound = to_binary(set_lower_bound(instance[4], input_data[-1])[0], distance_bits)
-
-            # Find the maximum courier distance
-            max_val = [[Bool(f"max_{j}_{i}_{iter}") for i in range(distance_bits)] 
-                                                    for j in range(couriers)]
-            self.solver.add(
-                max_of_bin_int(
-                        [results[-1][k] for k in range(couriers)], 
-                        max_val, 
-                        f'max_obj{iter}'
-                    )
-            )
-
-            # Makee sure the maximum value is bounded
-            self.solver.add(greater_eq(conv_upper_bound, max_val[-1], f"up_bound{iter}"))
-            self.solver.add(greater_eq(max_val[-1], lower_bound, f"low_bound{iter}"))
+            # Make sure the maximum value is bounded
+            active = self.bound_literal(objective, upper_bound, f"up_bound{iter}")
 
             # Check the satisfiability
-            status = self.solver.check()
+            status = self.check(active, bound=upper_bound)
 
-            try_timeout = t.time() - start_time
+            try_timeout = self.deadline.elapsed()
 
             if status == unsat:
                 if iter == 0:
@@ -245,115 +497,174 @@ class SATSolver:
 
             elif status == sat:
                 iter += 1
+                # Keep the model as incumbent, it is decoded only for the final answer
                 model = self.solver.model()
 
                 # update the upper bound
-                max_val_binary = [model.evaluate(max_val[-1][j]) for j in range(distance_bits)]  # extract the value of z3 variable
+                max_val_binary = [model.evaluate(objective[j]) for j in range(distance_bits)]  # extract the value of z3 variable
                 upper_bound = convert_from_binary_to_int(max_val_binary)
                 upper_bound = upper_bound - 1
 
-                # Save the best solution in case of timeout (optimal=False)
-                evaluation = self.get_solution(model, results)  # evaluate model on each component of result
-                final_evaluation = [sorting_correspondence(res, correspondence_dict)
-                                    for res in evaluation]
-                output_dict = self.format_output(final_evaluation, optimal, try_timeout)
+                # The next bound is tighter, so the current one can be retired
+                self.solver.add(Not(active))
 
-            if (self.timeout - try_timeout) < 0:
+            if self.deadline.expired():
                 if iter == 0:
                     raise TimeoutError("Solver timed out before finding any solution.")
                 # output = False
-                output_dict = self.format_output(final_evaluation, optimal, try_timeout)
-                self.print_solution(final_evaluation, round(try_timeout, 3), optimal=False)
-                return output_dict
+                return self.final_solution(model, results, correspondence_dict, optimal, try_timeout)
             
         if model:
             # This case happens only when the model has become unsatisfiable, but we still had time (optimal=True)
             optimal = True
-            evaluation = self.get_solution(model, results)
-            final_evaluation = [sorting_correspondence(res, correspondence_dict)
-                                for res in evaluation]
-
-            self.print_solution(final_evaluation, round(try_timeout, 3))
-            output_dict = self.format_output(final_evaluation, optimal, try_timeout)
-            return output_dict
+            return self.final_solution(model, results, correspondence_dict, optimal, try_timeout)
         else:
             raise ValueError("No satisfiable model was found during the search.")
 
     def binary_search(self, instance):
         self.window.print_output("Starting optimization exploiting binary search")
 
-        input_data, correspondence_dict = binarizer.binarize(instance)
-        couriers = input_data[0]
-        distance_bits = input_data[6]
-
-        lower_bound = set_lower_bound(instance[4], input_data[-1])[0]
-        upper_bound = set_upper_bound(instance[4], input_data[-1], couriers)
-
-        self.solver, results = set_constraints(input_data, self.solver, self.symmetry)
-        self.window.print_output('Model built, starting optimization process search')
+        # The objective network is shared by all the probes, only the bounds are retracted
+        input_data, correspondence_dict, results, objective, lower_bound, upper_bound = self.build_model(instance)
 
         model = None
-        output_dict = None
         optimal = False
         iter = 0
-        start_time = t.time()
+        probe = 0
 
         while lower_bound <= upper_bound:
             mid = (lower_bound + upper_bound) // 2
-            conv_upper_bound = to_binary(mid, distance_bits)
-            conv_lower_bound = to_binary(lower_bound, distance_bits)
 
-            # Find the maximum courier distance
-            max_val = [[Bool(f"max_{j}_{i}_{iter}") for j in range(distance_bits)] for i in range(couriers)]
-            self.solver.add(
-                max_of_bin_int(
-                    [results[-1][k] for k in range(couriers)],
-                    max_val,
-                    f'max_obj{iter}'
-                )
-            )
+            base = self.solver.assertions()
+            bounds = self.objective_bounds(objective, mid, f"bound{probe}", lower_bound)
 
             self.solver.push()
-            self.solver.add(greater_eq(conv_upper_bound, max_val[-1], f"up_bound{iter}"))
-            self.solver.add(greater_eq(max_val[-1], conv_lower_bound, f"low_bound{iter}"))
-
-            status = self.solver.check()
-            try_timeout = t.time() - start_time
+            self.solver.add(bounds)
+
+            # Size of the probe and of the base formula it is added to, to check that the
+            # base does not grow from one probe to the next. Counting the whole base walks
+            # every assertion within the time of the search, so it is only done when profiling
+            self.probe_stats.append({
+                'bound': mid,
+                'base_assertions': len(base),
+                'base_expressions': count_expressions(base) if self.profile else None,
+                'clauses': count_clauses(bounds),
+                'variables': count_variables(bounds, exclude=objective)
+            })
+            probe += 1
+
+            status = self.check(bound=mid)
+            try_timeout = self.deadline.elapsed()
 
             if status == unsat:
-                if iter == 0:
+                if iter == 0 and upper_bound == mid:
                     self.window.print_output('Unsat')
                     raise ValueError("The instance is unsatisfiable")
                 lower_bound = mid + 1
 
             elif status == sat:
                 iter += 1
+                # Keep the model as incumbent, it is decoded only for the final answer
                 model = self.solver.model()
-
-                # Save the best solution in case of timeout
-                evaluation = self.get_solution(model, results)
-                final_evaluation = [sorting_correspondence(res, correspondence_dict)
-                                    for res in evaluation]
-                output_dict = self.format_output(final_evaluation, optimal, try_timeout)
                 upper_bound = mid - 1
 
             self.solver.pop()
 
-            if (self.timeout - try_timeout) < 0:
+            if self.deadline.expired():
                 if iter == 0:
                     raise TimeoutError("Solver timed out before finding any solution.")
-                output_dict = self.format_output(final_evaluation, optimal, try_timeout)
-                self.print_solution(final_evaluation, round(try_timeout, 3), optimal=False)
-                return output_dict
+                self.print_probe_stats()
+                return self.final_solution(model, results, correspondence_dict, optimal, try_timeout)
 
+        self.print_probe_stats()
         if model:
             optimal = True
-            evaluation = self.get_solution(model, results)
-            final_evaluation = [sorting_correspondence(res, correspondence_dict)
-                                for res in evaluation]
-            self.print_solution(final_evaluation, round(try_timeout, 3))
-            output_dict = self.format_output(final_evaluation, optimal, try_timeout)
-            return output_dict
+            return self.final_solution(model, results, correspondence_dict, optimal, try_timeout)
         else:
             raise ValueError("No satisfiable model was found during the search.")
 
+    def hybrid_search(self, instance):
+        """
+        Bottom-up and top-down tracks interleaved on the same solver. The bottom-up track
+        proves lower bounds by checking "objective <= lower_bound" under an assumption, the
+        top-down track improves the incumbent by checking "objective <= incumbent - 1".
+        Each check runs for the time slice of its track, doubled whenever the slice ends
+        without an answer, and the search stops as soon as the two bounds meet.
+
+        On timeout the proven lower bound is reported with the incumbent.
+        """
+        self.window.print_output("Starting optimization exploiting hybrid search")
+
+        input_data, correspondence_dict, results, objective, lower_bound, upper_bound = self.build_model(instance)
+        distance_bits = input_data[6]
+
+        model = None
+        optimal = False
+        iter = 0
+        probe = 0
+        slices = {'top_down': settings.HYBRID_TIME_SLICE, 'bottom_up': settings.HYBRID_TIME_SLICE}
+        track = 'top_down'
+
+        while lower_bound <= upper_bound:
+            bound = upper_bound if track == 'top_down' else lower_bound
+            active = self.bound_literal(objective, bound, f"{track}{probe}")
+            probe += 1
+
+            status = self.check(active, budget=slices[track], bound=bound, track=track)
+            try_timeout = self.deadline.elapsed()
+
+            if status == sat:
+                iter += 1
+                # Keep the model as incumbent, it is decoded only for the final answer
+                model = self.solver.model()
+                max_val_binary = [model.evaluate(objective[j]) for j in range(distance_bits)]
+                upper_bound = convert_from_binary_to_int(max_val_binary) - 1
+                self.solver.add(Not(active))
+
+            elif status == unsat:
+                if model is None and bound >= upper_bound and self.check(budget=slices[track], track='no_bound') == unsat:
+                    # Nothing within the initial upper bound and nothing without a bound
+                    # either: the constraints are unsatisfiable. The unsat core cannot tell
+                    # it, the tactic pipelines always return an empty one
+                    self.window.print_output('Unsat')
+                    raise ValueError("The instance is unsatisfiable")
+                # No solution within the bound: it is a proven lower bound
+                lower_bound = bound + 1
+                if lower_bound <= upper_bound:
+                    self.solver.add(greater_eq(objective, to_binary(lower_bound, distance_bits), f"proven{probe}"))
+
+            else:
+                slices[track] *= 2
+
+            if self.deadline.expired():
+                if iter == 0:
+                    raise TimeoutError("Solver timed out before finding any solution.")
+                break
+
+            track = 'bottom_up' if track == 'top_down' else 'top_down'
+
+        if not model:
+            raise ValueError("No satisfiable model was found during the search.")
+
+        optimal = lower_bound > upper_bound
+        solution = self.final_solution(model, results, correspondence_dict, optimal, try_timeout)
+        if not optimal:
+            self.window.print_output(f"Proven lower bound: {lower_bound}, gap: {solution['obj'] - lower_bound}")
+        solution['lower_bound'] = min(lower_bound, solution['obj'])
+        return solution
+
+    def print_probe_stats(self):
+        """
+        Prints the size of each bisection probe and of the base formula it was added to.
+        """
+        if not self.probe_stats:
+            return
+
+        self.window.print_output("Probes:")
+        for i, stats in enumerate(self.probe_stats):
+            self.window.print_output(
+                f"  probe {i}: bound {stats['bound']}, +{stats['clauses']} clauses, "
+                f"+{stats['variables']} variables, base {stats['base_assertions']} assertions"
+                + (f" of {stats['base_expressions']} expressions" if stats['base_expressions'] is not None else "")
+            )
+
@@ -2,7 +2,8 @@ import os
 import json
 import numpy as np
 
-from z3.z3 import Implies, And, Or, Not, Bool, Xor
+from z3.z3 import Implies, And, Or, Not, Bool, Xor, Goal, Tactic, is_const, Z3_OP_UNINTERPRETED
+from z3.z3core import Z3_goal_num_exprs
 
 
 def set_upper_bound(distances, sub_tour, couriers):
@@ -238,4 +239,54 @@ def saving_file(json_dict, path, filename):
         os.makedirs(path)
         
     with open(path + filename, 'w') as file:
-        json.dump(json_dict, file)
\ No newline at end of file
+        json.dump(json_dict, file)
+
+
+def variable_ids(expr):
+    """
+    :param expr: z3 expression
+    :return: set with the ids of the distinct z3 variables appearing in expr
+    """
+    seen = set()
+    variables = set()
+    stack = [expr]
+    while stack:
+        e = stack.pop()
+        if e.get_id() in seen:
+            continue
+        seen.add(e.get_id())
+        if is_const(e) and e.decl().kind() == Z3_OP_UNINTERPRETED:
+            variables.add(e.get_id())
+        else:
+            stack.extend(e.children())
+    return variables
+
+
+def count_variables(expr, exclude=()):
+    """
+    :param expr: z3 expression
+    :param exclude: z3 variables which must not be counted (e.g. already existing ones)
+    :return: number of distinct z3 variables appearing in expr
+    """
+    excluded = {var.get_id() for var in exclude}
+    return len(variable_ids(expr) - excluded)
+
+
+def count_clauses(expr):
+    """
+    :param expr: z3 boolean expression
+    :return: number of clauses of the Tseitin CNF of expr
+    """
+    goal = Goal()
+    goal.add(expr)
+    return sum(len(subgoal) for subgoal in Tactic('tseitin-cnf')(goal))
+
+
+def count_expressions(exprs):
+    """
+    :param exprs: z3 expressions (e.g. the assertions of a solver)
+    :return: number of distinct subexpressions of exprs, counted natively by z3
+    """
+    goal = Goal()
+    goal.add(exprs)
+    return Z3_goal_num_exprs(goal.ctx.ref(), goal.goal)
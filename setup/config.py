@@ -40,4 +40,21 @@ class GlobalObjects():
             return self.objects[key.lower()]
 
 
+class OutputBuffer():
+    """
+    Stand-in for the GUI window in processes without one (e.g. pool workers):
+    the messages are kept until flushed.
+    """
+    def __init__(self, *args, **kwargs) :
+        self.lines = []
+
+    def print_output(self, message=None) :
+        if message :
+            self.lines.append(message)
+
+    def flush(self) :
+        lines, self.lines = self.lines, []
+        return lines
+
+
 glob = GlobalObjects()
\ No newline at end of file
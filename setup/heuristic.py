@@ -0,0 +1,75 @@
+def greedy_assignment(m, n, capacities, sizes):
+    """
+    Worst-fit decreasing assignment: the items, from the largest one, are given to the
+    courier with the most remaining capacity. Couriers left empty then take an item from
+    the courier carrying the most items: with the triangle inequality a single item route
+    is never longer than the route it leaves.
+
+    :return: for each courier the list of its items (0-based), None if an item does not fit
+    """
+    remaining = list(capacities)
+    assignment = [[] for _ in range(m)]
+
+    for i in sorted(range(n), key=lambda i: -sizes[i]):
+        k = max(range(m), key=lambda k: remaining[k])
+        if remaining[k] < sizes[i]:
+            return None
+        assignment[k].append(i)
+        remaining[k] -= sizes[i]
+
+    for k in range(m):
+        if assignment[k]:
+            continue
+        donors = sorted((c for c in range(m) if len(assignment[c]) > 1), key=lambda c: -len(assignment[c]))
+        for c in donors:
+            movable = [i for i in assignment[c] if sizes[i] <= remaining[k]]
+            if movable:
+                i = movable[0]
+                assignment[c].remove(i)
+                assignment[k].append(i)
+                remaining[c] += sizes[i]
+                remaining[k] -= sizes[i]
+                break
+
+    return assignment
+
+
+def nearest_neighbour_route(items, distances, depot):
+    """
+    :param items: items to be visited
+    :param distances: distance matrix, the depot being the node depot
+    :return: the items in the order visited by always travelling to the nearest one left
+    """
+    route = []
+    left = set(items)
+    current = depot
+    while left:
+        current = min(left, key=lambda j: (distances[current][j], j))
+        route.append(current)
+        left.remove(current)
+    return route
+
+
+def route_distance(route, distances, depot):
+    """
+    :return: length of the tour depot -> route -> depot
+    """
+    stops = [depot] + list(route) + [depot]
+    return sum(distances[stops[i]][stops[i + 1]] for i in range(len(stops) - 1))
+
+
+def heuristic_solution(m, n, capacities, sizes, distances):
+    """
+    Fast feasible solution: greedy assignment of the items followed by nearest neighbour
+    routes. Its objective is a valid upper bound for every approach.
+
+    :return: (routes with 0-based items, maximum route distance), None if no assignment is found
+    """
+    assignment = greedy_assignment(m, n, capacities, sizes)
+    if assignment is None:
+        return None
+
+    depot = n
+    routes = [nearest_neighbour_route(items, distances, depot) for items in assignment]
+    objective = max(route_distance(route, distances, depot) for route in routes)
+    return routes, objective
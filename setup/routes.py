@@ -0,0 +1,67 @@
+def successor_array(arcs, nodes):
+    """
+    Turns the travel decisions of a solution into a successor array.
+
+    :param arcs: iterable of (i, j) couples, one for each travel i -> j
+    :param nodes: number of nodes
+    :return: list where the i-th element is the successor of node i (None if it has no travel)
+    """
+    successors = [None] * nodes
+    for i, j in arcs:
+        if successors[i] is not None and successors[i] != j:
+            raise ValueError(f"Node {i} has more than one successor")
+        successors[i] = j
+    return successors
+
+
+def trace_route(successors, first, depot):
+    """
+    Follows the successor array from the first node of a route until the depot, visiting
+    each node once.
+
+    :param successors: successor array returned by successor_array
+    :param first: first node visited after leaving the depot
+    :param depot: index of the depot
+    :return: list of the visited nodes, depot excluded
+    """
+    route = []
+    visited = set()
+    node = first
+    while node != depot:
+        if node is None:
+            raise ValueError("The route is interrupted before returning to the depot")
+        if node in visited:
+            raise ValueError(f"The route contains a cycle through node {node}")
+        visited.add(node)
+        route.append(node)
+        node = successors[node]
+    return route
+
+
+def find_subtours(successors, depot):
+    """
+    Finds the cycles of a successor array which do not pass through the depot.
+
+    :param successors: successor array returned by successor_array
+    :param depot: index of the depot
+    :return: list of the cycles, each one as the list of its nodes
+    """
+    visited = {depot}
+    node = successors[depot]
+    while node is not None and node not in visited:
+        visited.add(node)
+        node = successors[node]
+
+    subtours = []
+    for start, successor in enumerate(successors):
+        if successor is None or start in visited:
+            continue
+        cycle = []
+        node = start
+        while node is not None and node not in visited:
+            visited.add(node)
+            cycle.append(node)
+            node = successors[node]
+        if node == start:
+            subtours.append(cycle)
+    return subtours